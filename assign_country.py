@@ -21,11 +21,19 @@ import warnings
 # Ignore all future warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
+hexagon_path = 'Data/hex_final.geojson'
+output_path = 'Data/hexagons_with_country.geojson'
 
-hexagons = gpd.read_file('Data/hex_final.geojson')
-hexagons.to_crs(epsg=4326, inplace=True)
-world = gpd.read_file(gpd.datasets.get_path('naturalearth_lowres')) # may need to switch to higher res
-countries = world.drop(columns=['pop_est', 'continent', 'iso_a3', 'gdp_md_est'])
-countries = countries.rename(columns={'name':'country'})
-hexagons_with_country = gpd.sjoin(hexagons, countries, op='intersects') # changed from "within"
-hexagons_with_country.to_file('Data/hexagons_with_country.geojson', driver='GeoJSON')
\ No newline at end of file
+
+def main():
+    hexagons = gpd.read_file(hexagon_path)
+    hexagons.to_crs(epsg=4326, inplace=True)
+    world = gpd.read_file(gpd.datasets.get_path('naturalearth_lowres')) # may need to switch to higher res
+    countries = world.drop(columns=['pop_est', 'continent', 'iso_a3', 'gdp_md_est'])
+    countries = countries.rename(columns={'name':'country'})
+    hexagons_with_country = gpd.sjoin(hexagons, countries, op='intersects') # changed from "within"
+    hexagons_with_country.to_file(output_path, driver='GeoJSON')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,93 +1,130 @@
 
-import pandas as pd
 import numpy as np
 import math
+from functools import lru_cache
+from parameters import trucking_parameters, pipeline_parameters, pipeline_size_parameters
 
 def CRF(interest,lifetime):
     '''
     Calculates the capital recovery factor of a capital investment.
 
+    Interest rates and lifetimes are broadcast against each other, so whole
+    columns of rates can be passed at once. The factor of a zero interest
+    rate is its limit, 1/lifetime.
+
     Parameters
     ----------
-    interest : float
+    interest : float or array-like
         interest rate.
-    lifetime : float or integer
+    lifetime : float, integer or array-like
         lifetime of asset.
 
     Returns
     -------
-    CRF : float
-        present value factor.
+    CRF : float or numpy array
+        present value factor, as a float if both arguments are scalars.
 
     '''
-    interest = float(interest)
-    lifetime = float(lifetime)
+    if np.ndim(interest) == 0 and np.ndim(lifetime) == 0:
+        # the same few rates and lifetimes are used for every hexagon, so scalar factors are cached
+        return _CRF_scalar(float(interest), float(lifetime))
+    return _CRF_array(interest, lifetime)
+
+
+def _CRF_array(interest, lifetime):
+    interest = np.asarray(interest, dtype=float)
+    lifetime = np.asarray(lifetime, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # log1p and expm1 keep precision for small interest rates
+        log_growth = lifetime*np.log1p(interest)
+        factor = interest*np.exp(log_growth)/np.expm1(log_growth)
+        return np.where(interest == 0, 1/lifetime, factor)
+
+
+@lru_cache(maxsize=1024)
+def _CRF_scalar(interest, lifetime):
+    return float(_CRF_array(interest, lifetime))
 
-    CRF = (((1+interest)**lifetime)*interest)/(((1+interest)**lifetime)-1)
-    return CRF
 
 transport_excel_path = "Parameters/transport_parameters.xlsx"
 
 def calculate_trucking_costs(distance, quantity, interest, excel_path):
     '''
-    calculates the annual cost of transporting hydrogen by truck.
+    calculates the annual cost of transporting ammonia by truck.
+
+    Scalar version of calculate_trucking_costs_array().
 
     Parameters
     ----------
     distance : float
-        distance between hydrogen production site and demand site.
+        distance between ammonia production site and demand site in km.
     quantity : float
-        annual amount of hydrogen to transport.
+        annual amount of ammonia to transport.
     interest : float
         interest rate on capital investments.
     excel_path : string
         path to transport_parameters.xlsx file
-        
+
     Returns
     -------
     cost_per_unit : float
         annual cost of ammonia transport per kilogram of ammonia.
     '''
+    return float(calculate_trucking_costs_array(distance, quantity, interest, excel_path))
+
+
+def calculate_trucking_costs_array(distance, quantity, interest, excel_path):
+    '''
+    calculates the annual cost of transporting ammonia by truck for many hexagons at once.
+
+    Parameters
+    ----------
+    distance : numpy array
+        distances between ammonia production sites and demand site in km.
+    quantity : float
+        annual amount of ammonia to transport.
+    interest : float or numpy array
+        interest rates on capital investments at each production site.
+    excel_path : string
+        path to transport_parameters.xlsx file
+
+    Returns
+    -------
+    cost_per_unit : numpy array
+        annual cost of ammonia transport per kilogram of ammonia.
+    '''
+    distance = np.asarray(distance, dtype=float)
+    interest = np.asarray(interest, dtype=float)
     daily_quantity = quantity/365
-    transport_parameters = pd.read_excel(excel_path,
-                                         sheet_name = 'NH3',
-                                         index_col = 'Parameter'
-                                         ).squeeze('columns')
-
-    average_truck_speed = transport_parameters['Average truck speed (km/h)']                #km/h
-    working_hours = transport_parameters['Working hours (h/day)']                     #h/day
-    diesel_price = transport_parameters['Diesel price (euros/L)']                    #€/l
-    costs_for_driver = transport_parameters['Costs for driver (euros/h)']                  #€/h
-    working_days = transport_parameters['Working days (per year)']                      #per year
-    max_driving_dist = transport_parameters['Max driving distance (km/a)']               #km/a Maximum driving distance per truck per year
-
-    spec_capex_truck = transport_parameters['Spec capex truck (euros)']               #€
-    spec_opex_truck = transport_parameters['Spec opex truck (% of capex/a)']                  #% of CAPEX/a
-    diesel_consumption = transport_parameters['Diesel consumption (L/100 km)']                 #l/100km
-    truck_lifetime = transport_parameters['Truck lifetime (a)']                      #a
-
-    spec_capex_trailor = transport_parameters['Spec capex trailer (euros)']
-    spec_opex_trailor =transport_parameters['Spec opex trailer (% of capex/a)']
-    net_capacity = transport_parameters['Net capacity (kg NH3)']                     #kgh2
-    trailor_lifetime = transport_parameters['Trailer lifetime (a)']                   #a
-    loading_unloading_time = transport_parameters['Loading unloading time (h)']            #hours 
-
-
-    # max_day_dist = max_driving_dist/working_days
+    transport_parameters = trucking_parameters(excel_path)
+
+    average_truck_speed = transport_parameters.average_truck_speed
+    working_hours = transport_parameters.working_hours
+    diesel_price = transport_parameters.diesel_price
+    costs_for_driver = transport_parameters.costs_for_driver
+    working_days = transport_parameters.working_days
+    spec_capex_truck = transport_parameters.spec_capex_truck
+    spec_opex_truck = transport_parameters.spec_opex_truck
+    diesel_consumption = transport_parameters.diesel_consumption
+    truck_lifetime = transport_parameters.truck_lifetime
+    spec_capex_trailor = transport_parameters.spec_capex_trailor
+    spec_opex_trailor = transport_parameters.spec_opex_trailor
+    net_capacity = transport_parameters.net_capacity
+    trailor_lifetime = transport_parameters.trailor_lifetime
+    loading_unloading_time = transport_parameters.loading_unloading_time
+
     amount_deliveries_needed = daily_quantity/net_capacity
     deliveries_per_truck = working_hours/(loading_unloading_time+(2*distance/average_truck_speed))
-    trailors_needed = round((amount_deliveries_needed/deliveries_per_truck)+0.5,0)
-    # total_drives_day = round(amount_deliveries_needed+0.5,0) # not in ammonia calculation
+    # np.round rounds halves to even, like the built-in round()
+    trailors_needed = np.round((amount_deliveries_needed/deliveries_per_truck)+0.5, 0)
     trucks_needed = trailors_needed
 
     capex_trucks = trucks_needed * spec_capex_truck
     capex_trailor = trailors_needed * spec_capex_trailor
-    # capex_total = capex_trailor + capex_trucks
-    # this if statement seems suspect to me-- how can a fractional number of deliveries be completed?
+    # the number of deliveries only depends on the quantity, so is the same for every hexagon
     if amount_deliveries_needed < 1:
         fuel_costs = (amount_deliveries_needed*2*distance*365/100)*diesel_consumption*diesel_price
         wages = amount_deliveries_needed * ((distance/average_truck_speed)*2+loading_unloading_time) * working_days * costs_for_driver
-    
     else:
         fuel_costs = (round(amount_deliveries_needed+0.5)*2*distance*365/100)*diesel_consumption*diesel_price
         wages = round(amount_deliveries_needed+0.5) * ((distance/average_truck_speed)*2+loading_unloading_time) * working_days * costs_for_driver
@@ -103,12 +140,14 @@ def calculate_pipeline_costs(distance,quantity,elec_cost,interest):
     '''
     calculates the annualized cost of building a pipeline.
 
+    Scalar version of calculate_pipeline_costs_array().
+
     Parameters
     ----------
     distance : float
         distance from production site to demand site in km.
     quantity : float
-        annual quantity of hydrogen demanded in kg.
+        annual quantity of ammonia demanded in kg.
     elec_cost : float
         price of electricity along pipeline in euros.
     interest : float
@@ -122,50 +161,67 @@ def calculate_pipeline_costs(distance,quantity,elec_cost,interest):
         size of pipeline to build
 
     '''
+    cost_per_unit, pipeline_type = calculate_pipeline_costs_array(distance, quantity, elec_cost, interest)
+    return float(cost_per_unit), pipeline_type
+
+
+def calculate_pipeline_costs_array(distance,quantity,elec_cost,interest):
+    '''
+    calculates the annualized cost of building a pipeline for many hexagons at once.
+
+    Parameters
+    ----------
+    distance : numpy array
+        distances from production sites to demand site in km.
+    quantity : float
+        annual quantity of ammonia demanded in kg.
+    elec_cost : float or numpy array
+        price of electricity along each pipeline in euros.
+    interest : float or numpy array
+        interest rates on capital investments at each production site.
+
+    Returns
+    -------
+    cost_per_unit : numpy array
+        annual costs for pipeline per kilogram of ammonia transported.
+    string
+        size of pipeline to build
+
+    '''
+    distance = np.asarray(distance, dtype=float)
+    elec_cost = np.asarray(elec_cost, dtype=float)
+    interest = np.asarray(interest, dtype=float)
     quantity = quantity / 1000 # convert kg to t
-    all_parameters = pd.read_excel(pipeline_excel_path,
-                                   sheet_name='All',
-                                    index_col = 'Parameter'
-                                    ).squeeze('columns')
-    opex = all_parameters['Opex (% of capex)']
-    availability = all_parameters['Availability']
-    lifetime_pipeline = all_parameters['Pipeline lifetime (a)']
-    # lifetime_compressors = all_parameters['Compressor lifetime (a)']
-    electricity_demand = all_parameters['Electricity demand (kWh/kg*km)']
-    large_max_flow = all_parameters['Large pipeline max capacity (t NH3/a)']*availability
-    large_min_flow = all_parameters['Large pipeline min capacity (t NH3/a)']*availability # t to kg
-    med_min_flow = all_parameters['Medium pipeline min capacity (t NH3/a)']*availability # t to kg
-    small_min_flow = all_parameters['Small pipeline min capcity (t NH3/a)']*availability # t to kg
-    # if demand is large enough, split flow into multiple pipelines
+    all_parameters = pipeline_parameters(pipeline_excel_path)
+    opex = all_parameters.opex
+    availability = all_parameters.availability
+    lifetime_pipeline = all_parameters.lifetime_pipeline
+    electricity_demand = all_parameters.electricity_demand
+    large_max_flow = all_parameters.large_max_capacity*availability
+    large_min_flow = all_parameters.large_min_capacity*availability
+    med_min_flow = all_parameters.med_min_capacity*availability
+    small_min_flow = all_parameters.small_min_capacity*availability
+    # pipeline size only depends on the quantity, so is the same for every hexagon
     if quantity > large_max_flow:
         n_pipelines = math.ceil(quantity/large_max_flow)
         quantity_per_pipeline = quantity / n_pipelines
     else:
         n_pipelines = 1
         quantity_per_pipeline = quantity
-        
+
     if quantity_per_pipeline >= small_min_flow and quantity_per_pipeline < med_min_flow:
         pipeline_type = 'Small'
-    
     elif quantity_per_pipeline >= med_min_flow and quantity_per_pipeline < large_min_flow:
         pipeline_type = 'Medium'
-    
     elif quantity_per_pipeline >= large_min_flow and quantity_per_pipeline <= large_max_flow:
         pipeline_type = 'Large'
-    
     elif quantity_per_pipeline < small_min_flow:
-        return np.nan,'Flow too small for pipeline'
-    
-    pipeline_parameters = pd.read_excel(pipeline_excel_path,
-                                   sheet_name=pipeline_type,
-                                    index_col = 'Parameter'
-                                    ).squeeze('columns')
-    y_int = pipeline_parameters['Capex y-intercept (€/t/yr/100km)']
-    print(y_int)
-    slope = pipeline_parameters['Capex flow coefficient (€/t^2/yr^2/100km)']
-    print(slope)
+        return np.full(np.broadcast(distance, elec_cost, interest).shape, np.nan),'Flow too small for pipeline'
+
+    size_parameters = pipeline_size_parameters(pipeline_type, pipeline_excel_path)
+    y_int = size_parameters.y_int
+    slope = size_parameters.slope
     capex_coeff = (y_int + slope*quantity_per_pipeline)
-    print(capex_coeff)
     capex_annual = (n_pipelines*(capex_coeff*distance/100*quantity_per_pipeline)*CRF(interest,lifetime_pipeline)) # distance coefficients are per 100 km
     opex_annual = opex*n_pipelines*(capex_coeff*distance/100*quantity_per_pipeline)
     electricity_costs = electricity_demand * distance * quantity * elec_cost
@@ -173,3 +229,38 @@ def calculate_pipeline_costs(distance,quantity,elec_cost,interest):
     annual_costs = capex_annual + opex_annual + electricity_costs
     cost_per_unit = annual_costs/(quantity*1000) # convert back to kg
     return cost_per_unit, f"{pipeline_type} Pipeline"
+
+
+def calculate_road_construction_costs(road_distance, interest, lifetime,
+                                      road_capex_short, road_capex_long, road_opex):
+    '''
+    calculates the annual cost of building a road to each hexagon.
+
+    Roads shorter than 10 km are costed as short roads, and hexagons already
+    on a road cost nothing.
+
+    Parameters
+    ----------
+    road_distance : numpy array
+        distance from each hexagon to the nearest road in km.
+    interest : float or numpy array
+        interest rates on infrastructure investments in each hexagon.
+    lifetime : float or numpy array
+        lifetime of roads in each hexagon in years.
+    road_capex_short : float
+        capital cost of short roads per km.
+    road_capex_long : float
+        capital cost of long roads per km.
+    road_opex : float
+        annual operating cost of roads per km.
+
+    Returns
+    -------
+    road_construction_costs : numpy array
+        annual cost of road construction in each hexagon.
+    '''
+    road_distance = np.asarray(road_distance, dtype=float)
+    road_capex = np.where(road_distance < 10, road_capex_short, road_capex_long)
+    road_construction_costs = road_distance*road_capex*CRF(interest, lifetime)\
+        + road_distance*road_opex
+    return np.where(road_distance == 0, 0., road_construction_costs)
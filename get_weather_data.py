@@ -12,6 +12,11 @@ from the ERA-5 reanalysis dataset using Atlite.
 
 Create cutouts with `atlite <https://atlite.readthedocs.io/en/latest/>`_.
 
+Large cutouts are split into tiles of one month and a block of grid cells,
+which are prepared a few at a time in separate processes, retried if they
+fail, and merged into the cutout. Tiles prepared before a failed run are kept, so the run can be
+restarted without downloading them again.
+
 For this rule to work you must have
 
 - installed the `Copernicus Climate Data Store <https://cds.climate.copernicus.eu>`_ ``cdsapi`` package  (`install with `pip``) and
@@ -25,41 +30,213 @@ For this rule to work you must have
 import logging
 import atlite
 # import geopandas as gpd
-import pandas as pd
+import parameters
 # from _helpers import configure_logging
 import os
+import shutil
+import time
+import xarray as xr
+from atlite.gis import get_coords
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 weather_excel_path = "Parameters/weather_parameters.xlsx"
 
-weather_parameters = pd.read_excel(weather_excel_path,
-                                   index_col = 'Parameters'
-                                   ).squeeze('columns')
-
-start_date = weather_parameters['Start date']
-end_date = weather_parameters['End date (not inclusive)']
-min_lon = weather_parameters['Minimum longitude (deg)']
-max_lon = weather_parameters['Maximum longitude (deg)']
-min_lat = weather_parameters['Minimum latitude (deg)']
-max_lat = weather_parameters['Maximum latitude (deg)']
-filename = weather_parameters['Filename']
-
-
-snapshots = slice(start_date, end_date) # date range to import, end not inclusive
-
-# Create folders for final cutouts and temporary files
-if not os.path.exists('Cutouts'):
-    os.makedirs('Cutouts')
-if not os.path.exists('temp'):
-    os.makedirs('temp')
-
-cutout = atlite.Cutout(
-    path="Cutouts/" + filename + ".nc",
-    module="era5",
-    x=slice(min_lon, max_lon),
-    y=slice(min_lat, max_lat),
-    time=snapshots,
-)
-
-cutout.prepare(['height','wind','influx','temperature'], tmpdir="temp") # TEMPDIR DEFINITION IS NEW TO FIX ERROR
\ No newline at end of file
+features = ['height', 'wind', 'influx', 'temperature']
+
+# split the request into tiles which are prepared separately and merged-- False prepares the cutout at once
+tiled = True
+# each tile covers one month, and up to this many grid cells in longitude and latitude-- None for the whole box
+tile_cells = 40
+# number of tiles prepared at the same time-- the CDS API queues requests beyond a few per user
+max_workers = 4
+# attempts to prepare each tile, waiting retry_delay seconds after the first failure and twice as long after each next
+max_attempts = 3
+retry_delay = 60
+
+
+def weather_tiles(x, y, snapshots, cells=None):
+    '''
+    splits the coordinates of a cutout into monthly tiles of grid cells.
+
+    Parameters
+    ----------
+    x, y : slice
+        longitude and latitude bounds of the cutout in degrees.
+    snapshots : slice
+        date range of the cutout.
+    cells : int, optional
+        maximum number of grid cells of a tile in longitude and latitude.
+        Default is None, which does not split the cutout in space.
+
+    Returns
+    -------
+    tiles : dict
+        x, y and time slices of each tile, keyed by tile name. Tiles do not
+        overlap and together cover the coordinates of the cutout.
+    '''
+    # tiles are cut from the coordinates atlite would give the whole cutout, so they fit together exactly
+    coords = get_coords(x, y, snapshots)
+    times = coords.indexes['time']
+
+    def split(values):
+        size = len(values) if cells is None else cells
+        return [values[i:i + size] for i in range(0, len(values), size)]
+
+    tiles = {}
+    for period in times.to_period('M').unique():
+        month = times[times.to_period('M') == period]
+        for i, tile_x in enumerate(split(coords.indexes['x'])):
+            for j, tile_y in enumerate(split(coords.indexes['y'])):
+                tiles[f'{period}_{i}_{j}'] = dict(x=slice(tile_x[0], tile_x[-1]),
+                                                  y=slice(tile_y[0], tile_y[-1]),
+                                                  time=slice(month[0], month[-1]))
+    return tiles
+
+
+def prepare_tile(path, tile, tmpdir):
+    '''
+    downloads the ERA5 weather of a tile from the CDS API into a cutout.
+
+    Parameters
+    ----------
+    path : string
+        path of the tile cutout.
+    tile : dict
+        x, y and time slices of the tile.
+    tmpdir : string
+        folder for temporary files of the download.
+    '''
+    cutout = atlite.Cutout(path=path, module='era5', **tile)
+    cutout.prepare(features, tmpdir=tmpdir)
+
+
+def _prepare_with_retries(prepare, path, tile, tmpdir, attempts, delay):
+    # a tile is prepared under a temporary name, so an existing tile file is always complete
+    partial_path = path[:-len('.nc')] + '.part.nc'
+    for attempt in range(attempts):
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        os.makedirs(tmpdir, exist_ok=True)
+        try:
+            prepare(partial_path, tile, tmpdir)
+            os.replace(partial_path, path)
+            return path
+        except Exception as error:
+            if attempt == attempts - 1:
+                raise
+            logger.warning(f'Preparing {os.path.basename(path)} failed ({error}). '
+                           f'Retrying in {delay * 2**attempt} s.')
+            time.sleep(delay * 2**attempt)
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def build_cutout(path, x, y, snapshots, prepare=prepare_tile, tile_dir='temp/tiles', cells=tile_cells,
+                 workers=max_workers):
+    '''
+    builds a cutout by preparing tiles in parallel processes and merging them.
+
+    Tiles which were prepared by an earlier run are kept, so a failed run
+    can be restarted without downloading them again.
+
+    Parameters
+    ----------
+    path : string
+        path of the cutout.
+    x, y : slice
+        longitude and latitude bounds of the cutout in degrees.
+    snapshots : slice
+        date range of the cutout.
+    prepare : function, optional
+        function called as prepare(path, tile, tmpdir) to write the cutout
+        of a tile, e.g. a local stand-in for the CDS API. It is run in worker
+        processes, so must be defined at module level. Default is
+        prepare_tile, which downloads ERA5 weather.
+    tile_dir : string, optional
+        folder for the tile cutouts. Default is "temp/tiles".
+    cells : int, optional
+        maximum number of grid cells of a tile in longitude and latitude.
+        Default is tile_cells.
+    workers : int, optional
+        number of worker processes preparing tiles. Default is max_workers.
+    '''
+    tiles = weather_tiles(x, y, snapshots, cells)
+    name = os.path.splitext(os.path.basename(path))[0]
+    tile_paths = {tile: os.path.join(tile_dir, f'{name}_{tile}.nc') for tile in tiles}
+    os.makedirs(tile_dir, exist_ok=True)
+
+    missing = [tile for tile in tiles if not os.path.exists(tile_paths[tile])]
+    logger.info(f'Preparing {len(missing)} of {len(tiles)} tiles of {name}')
+    failed = []
+    # netCDF4 and HDF5 are not thread-safe, so each worker prepares tiles in its own process
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_prepare_with_retries, prepare, tile_paths[tile], tiles[tile],
+                                   os.path.join(tile_dir, f'{name}_{tile}_tmp'), max_attempts, retry_delay): tile
+                   for tile in missing}
+        for future in as_completed(futures):
+            try:
+                future.result()
+                logger.info(f'Prepared tile {futures[future]}')
+            except Exception as error:
+                logger.error(f'Tile {futures[future]} failed after {max_attempts} attempts: {error}')
+                failed.append(futures[future])
+    if failed:
+        raise RuntimeError(f'Tiles {sorted(failed)} of {name} could not be prepared. '
+                           'Run again to retry them; prepared tiles are kept.')
+
+    # variables without a time dimension, e.g. height, are the same in every month
+    with xr.open_mfdataset(list(tile_paths.values()), combine='by_coords', data_vars='minimal',
+                           coords='minimal', compat='override', combine_attrs='override') as merged:
+        # write to a temporary file first so the cutout is never read while partly written
+        partial_path = path[:-len('.nc')] + '.part.nc'
+        merged.to_netcdf(partial_path)
+    os.replace(partial_path, path)
+    for tile_path in tile_paths.values():
+        os.remove(tile_path)
+
+
+def main():
+    weather_parameters = parameters.read_excel(weather_excel_path,
+                                               index_col = 'Parameters'
+                                               ).squeeze('columns')
+
+    start_date = weather_parameters['Start date']
+    end_date = weather_parameters['End date (not inclusive)']
+    min_lon = weather_parameters['Minimum longitude (deg)']
+    max_lon = weather_parameters['Maximum longitude (deg)']
+    min_lat = weather_parameters['Minimum latitude (deg)']
+    max_lat = weather_parameters['Maximum latitude (deg)']
+    filename = weather_parameters['Filename']
+
+
+    snapshots = slice(start_date, end_date) # date range to import, end not inclusive
+
+    # Create folders for final cutouts and temporary files
+    if not os.path.exists('Cutouts'):
+        os.makedirs('Cutouts')
+    if not os.path.exists('temp'):
+        os.makedirs('temp')
+
+    if tiled:
+        build_cutout("Cutouts/" + filename + ".nc",
+                     x=slice(min_lon, max_lon),
+                     y=slice(min_lat, max_lat),
+                     snapshots=snapshots)
+        return
+
+    cutout = atlite.Cutout(
+        path="Cutouts/" + filename + ".nc",
+        module="era5",
+        x=slice(min_lon, max_lon),
+        y=slice(min_lat, max_lat),
+        time=snapshots,
+    )
+
+    cutout.prepare(features, tmpdir="temp") # TEMPDIR DEFINITION IS NEW TO FIX ERROR
+
+
+if __name__ == '__main__':
+    main()
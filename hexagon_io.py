@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reads and writes the hexagon files passed between the stages of the model.
+
+Intermediate hexagon files are saved as GeoParquet in the Resources folder.
+Stages read only the columns they need, and stages that only add columns
+append them to the previous file without parsing its geometry. GeoJSON is
+only written for final results.
+"""
+
+import os
+
+import geopandas as gpd
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+resources_dir = 'Resources'
+
+
+def stage_path(stage, extension='parquet'):
+    '''
+    path to the hexagon file of a stage, e.g. "hex_transport".
+    '''
+    return os.path.join(resources_dir, f'{stage}.{extension}')
+
+
+def read_hexagons(stage, columns=None, geometry=True):
+    '''
+    reads the hexagon file of a stage.
+
+    Parameters
+    ----------
+    stage : string
+        name of stage, e.g. "hex_transport".
+    columns : list, optional
+        columns to read. Default is None, which reads all columns.
+    geometry : boolean, optional
+        whether to read hexagon geometry. Default is True.
+
+    Returns
+    -------
+    hexagons : geopandas GeoDataFrame or pandas DataFrame
+        hexagons, as a DataFrame without geometry if geometry is False.
+    '''
+    path = stage_path(stage)
+    if not geometry:
+        return pd.read_parquet(path, columns=columns)
+    if columns is not None:
+        columns = list(columns) + ['geometry']
+    return gpd.read_parquet(path, columns=columns)
+
+
+def column_names(stage):
+    '''
+    names of the columns in the hexagon file of a stage, read without loading the file.
+    '''
+    return pq.read_schema(stage_path(stage)).names
+
+
+def write_hexagons(hexagons, stage):
+    '''
+    saves all columns of the hexagons as the hexagon file of a stage.
+    '''
+    os.makedirs(resources_dir, exist_ok=True)
+    hexagons.to_parquet(stage_path(stage))
+
+
+def _index(table):
+    # converting the index columns with one data column gives the index without converting the others
+    index_columns = [column for column in table.schema.pandas_metadata['index_columns'] if isinstance(column, str)]
+    data_columns = [column for column in table.column_names if column not in index_columns]
+    return table.select(index_columns + data_columns[:1]).to_pandas().index
+
+
+def add_columns(source_stage, stage, columns):
+    '''
+    saves the hexagon file of a stage as the file of an earlier stage with
+    columns added, without parsing the geometry of the earlier file.
+
+    Parameters
+    ----------
+    source_stage : string
+        name of earlier stage.
+    stage : string
+        name of stage to save.
+    columns : pandas DataFrame
+        columns to add, with the same index as the hexagons. Columns which
+        already exist in the earlier file are replaced.
+    '''
+    table = pq.read_table(stage_path(source_stage))
+    if not columns.index.equals(_index(table)):
+        raise ValueError(f'columns to add do not match the hexagons of {source_stage}')
+    new_columns = pa.Table.from_pandas(columns, preserve_index=False)
+    for name, column in zip(new_columns.column_names, new_columns.columns):
+        if name in table.column_names:
+            table = table.set_column(table.column_names.index(name), name, column)
+        else:
+            table = table.append_column(name, column)
+    os.makedirs(resources_dir, exist_ok=True)
+    # write to a temporary file first so an interrupted run never leaves a partial file
+    path = stage_path(stage)
+    pq.write_table(table, f'{path}.{os.getpid()}')
+    os.replace(f'{path}.{os.getpid()}', path)
+
+
+def export_geojson(stage):
+    '''
+    saves the hexagon file of a stage as GeoJSON for use outside the model.
+    '''
+    hexagons = read_hexagons(stage)
+    # GeoJSON has no categorical type, so categories are saved as strings
+    categorical = hexagons.select_dtypes('category').columns
+    hexagons.astype({column: object for column in categorical}).to_file(stage_path(stage, 'geojson'),
+                                                                         driver='GeoJSON',
+                                                                         encoding='utf-8')
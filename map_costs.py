@@ -15,202 +15,73 @@ Description of edits:
  - Fixed up labels (LCOA instead of LCOH)
 """
 
-import geopandas as gpd
-import cartopy.crs as ccrs
-import matplotlib.pyplot as plt
-import pandas as pd
+import os
 
-hexagons = gpd.read_file('Resources/hex_total_cost.geojson')
-demand_excel_path = 'Parameters/demand_parameters.xlsx'
-demand_parameters = pd.read_excel(demand_excel_path,
-                                  index_col='Demand center',
-                                  )
+import hexagon_io
+import maps
+import parameters
 
-demand_centers = demand_parameters.index
-#%% plot LCOA for each hexagon
 # update central coordinates for area considered
-crs = ccrs.Orthographic(central_longitude = 37.5, central_latitude= 0.0)
-for demand_center in demand_centers:
-    
-    fig = plt.figure(figsize=(10,5))
-    
-    ax = plt.axes(projection=crs)
-    ax.set_axis_off()
-    
-    hexagons.to_crs(crs.proj4_init).plot(
-        ax=ax,
-        column = f'{demand_center} trucking production cost',
-        legend = True,
-        cmap = 'viridis_r',
-        legend_kwds={'label':'Production LCOA [euros/kg]'},
-        missing_kwds={
-            "color": "lightgrey",
-            "label": "Missing values",
-        },    
-    )
-    ax.set_title(f'{demand_center} trucking production cost')
-    fig.savefig(f'Resources\\{demand_center} trucking production cost.png', bbox_inches='tight')
-    
-    fig = plt.figure(figsize=(10,5))
-    
-    ax = plt.axes(projection=crs)
-    ax.set_axis_off()
-    
-    hexagons.to_crs(crs.proj4_init).plot(
-        ax=ax,
-        column = f'{demand_center} pipeline production cost',
-        legend = True,
-        cmap = 'viridis_r',
-        legend_kwds={'label':'Production LCOA [euros/kg]'},
-        missing_kwds={
-            "color": "lightgrey",
-            "label": "Missing values",
-        },    
-    )
-    ax.set_title(f'{demand_center} pipeline production cost')
-    fig.savefig(f'Resources\\{demand_center} pipeline production cost.png', bbox_inches='tight')
-
-    #%% plot transportation costs
-    fig = plt.figure(figsize=(10,5))
-    
-    ax = plt.axes(projection=crs)
-    ax.set_axis_off()
-    
-    
-    hexagons[f'{demand_center} total trucking cost'] =\
-        hexagons[f'{demand_center} trucking transport costs']+hexagons[f'{demand_center} road construction costs']
-    
-    hexagons.to_crs(crs.proj4_init).plot(
-        ax=ax,
-        column = f'{demand_center} total trucking cost',
-        legend = True,
-        cmap = 'viridis_r',
-        legend_kwds={'label':'Trucking cost [euros/kg]'},
-        missing_kwds={
-            "color": "lightgrey",
-            "label": "Missing values",
-        },    
-    )
-    ax.set_title(f'{demand_center} trucking transport costs')
-    fig.savefig(f'Resources\\{demand_center} trucking transport cost.png', bbox_inches='tight')
-    
-    fig = plt.figure(figsize=(10,5))
-    
-    ax = plt.axes(projection=crs)
-    ax.set_axis_off()
-    
-    hexagons.to_crs(crs.proj4_init).plot(
-        ax=ax,
-        column = f'{demand_center} pipeline transport costs',
-        legend = True,
-        cmap = 'viridis_r',
-        legend_kwds={'label':'Pipeline cost [euros/kg]'},
-        missing_kwds={
-            "color": "lightgrey",
-            "label": "Missing values",
-        },    
-    )
-    ax.set_title(f'{demand_center} pipeline transport costs')
-    fig.savefig(f'Resources\\{demand_center} pipeline transport cost.png', bbox_inches='tight')
-
-    # %% plot total costs
-
-    fig = plt.figure(figsize=(10,5))
-    
-    ax = plt.axes(projection=crs)
-    ax.set_axis_off()
-    
-    hexagons.to_crs(crs.proj4_init).plot(
-        ax=ax,
-        column = f'{demand_center} trucking total cost',
-        legend = True,
-        cmap = 'viridis_r',
-        legend_kwds={'label':'LCOA [euros/kg]'},
-        missing_kwds={
-            "color": "lightgrey",
-            "label": "Missing values",
-        },    
-    )
-    ax.set_title(f'{demand_center} trucking LCOA')
-    fig.savefig(f'Resources\\{demand_center} trucking LCOA.png', bbox_inches='tight')
-    
-    crs = ccrs.Orthographic(central_longitude = 37.5, central_latitude= 0.0)
-    
-    fig = plt.figure(figsize=(10,5))
-    
-    ax = plt.axes(projection=crs)
-    ax.set_axis_off()
-    
-    hexagons.to_crs(crs.proj4_init).plot(
-        ax=ax,
-        column = f'{demand_center} pipeline total cost',
-        legend = True,
-        cmap = 'viridis_r',
-        legend_kwds={'label':'LCOA [euros/kg]'},
-        missing_kwds={
-            "color": "lightgrey",
-            "label": "Missing values",
-        },    
-    )
-    ax.set_title(f'{demand_center} pipeline LCOA')
-    fig.savefig(f'Resources\\{demand_center} pipeline LCOA.png', bbox_inches='tight')
-
-    
-    fig = plt.figure(figsize=(10,5))
-    
-    ax = plt.axes(projection=crs)
-    ax.set_axis_off()
-    
-    hexagons.to_crs(crs.proj4_init).plot(
-        ax=ax,
-        column = f'{demand_center} lowest cost',
-        legend = True,
-        cmap = 'viridis_r',
-        legend_kwds={'label':'LCOA [euros/kg]'},
-        missing_kwds={
-            "color": "lightgrey",
-            "label": "Missing values",
-        },    
-    )
-    ax.set_title(f'{demand_center} LCOA')
-    fig.savefig(f'Resources\\{demand_center} LCOA.png', bbox_inches='tight')
-# %% plot water costs
-
-fig = plt.figure(figsize=(10,5))
-
-ax = plt.axes(projection=crs)
-ax.set_axis_off()
-
-hexagons.to_crs(crs.proj4_init).plot(
-    ax=ax,
-    column = 'Ocean water costs',
-    legend = True,
-    cmap = 'viridis_r',
-    legend_kwds={'label':'Water cost [euros/kg H2]'},
-    missing_kwds={
-        "color": "lightgrey",
-        "label": "Missing values",
-    },    
-)
-ax.set_title('Ocean water costs')
-fig.savefig(f'Resources\\Ocean water costs.png', bbox_inches='tight')
-
-fig = plt.figure(figsize=(10,5))
-
-ax = plt.axes(projection=crs)
-ax.set_axis_off()
-
-hexagons.to_crs(crs.proj4_init).plot(
-    ax=ax,
-    column = 'Freshwater costs',
-    legend = True,
-    cmap = 'viridis_r',
-    legend_kwds={'label':'Water cost [euros/kg H2]'},
-    missing_kwds={
-        "color": "lightgrey",
-        "label": "Missing values",
-    },    
-)
-ax.set_title('Freshwater costs')
-fig.savefig(f'Resources\\Freshwater costs.png', bbox_inches='tight')
-
+central_longitude = 37.5
+central_latitude = 0.0
+output_dir = 'Resources'
+# number of processes rendering figures
+n_workers = 4
+
+
+def main():
+    demand_excel_path = 'Parameters/demand_parameters.xlsx'
+    demand_parameters = parameters.read_excel(demand_excel_path,
+                                              index_col='Demand center',
+                                              )
+    demand_centers = demand_parameters.index
+
+    figures = []
+    for demand_center in demand_centers:
+        #%% plot LCOA for each hexagon
+        for transport in ['trucking', 'pipeline']:
+            figures.append(maps.MapFigure(f'{demand_center} {transport} production cost',
+                                          f'{demand_center} {transport} production cost',
+                                          'Production LCOA [euros/kg]',
+                                          f'{demand_center} {transport} production cost.png'))
+        #%% plot transportation costs
+        figures.append(maps.MapFigure(f'{demand_center} total trucking cost',
+                                      f'{demand_center} trucking transport costs',
+                                      'Trucking cost [euros/kg]',
+                                      f'{demand_center} trucking transport cost.png'))
+        figures.append(maps.MapFigure(f'{demand_center} pipeline transport costs',
+                                      f'{demand_center} pipeline transport costs',
+                                      'Pipeline cost [euros/kg]',
+                                      f'{demand_center} pipeline transport cost.png'))
+        # %% plot total costs
+        for transport in ['trucking', 'pipeline']:
+            figures.append(maps.MapFigure(f'{demand_center} {transport} total cost',
+                                          f'{demand_center} {transport} LCOA',
+                                          'LCOA [euros/kg]',
+                                          f'{demand_center} {transport} LCOA.png'))
+        figures.append(maps.MapFigure(f'{demand_center} lowest cost',
+                                      f'{demand_center} LCOA',
+                                      'LCOA [euros/kg]',
+                                      f'{demand_center} LCOA.png'))
+    # %% plot water costs
+    for water in ['Ocean water costs', 'Freshwater costs']:
+        figures.append(maps.MapFigure(water, water, 'Water cost [euros/kg H2]', f'{water}.png'))
+
+    trucking_columns = [f'{demand_center} {column}' for demand_center in demand_centers
+                        for column in ['trucking transport costs', 'road construction costs']]
+    derived_columns = [f'{demand_center} total trucking cost' for demand_center in demand_centers]
+    # only the columns which are mapped are read
+    columns = [figure.column for figure in figures if figure.column not in derived_columns] + trucking_columns
+    hexagons = hexagon_io.read_hexagons('hex_total_cost', columns=list(dict.fromkeys(columns)))
+    for demand_center in demand_centers:
+        hexagons[f'{demand_center} total trucking cost'] =\
+            hexagons[f'{demand_center} trucking transport costs']+hexagons[f'{demand_center} road construction costs']
+
+    rendered = maps.render_maps(hexagons, figures, central_longitude, central_latitude,
+                                output_dir, workers=n_workers)
+    for path in rendered:
+        print(f'Saved {os.path.basename(path)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exports maps of hexagon columns as PNG figures.
+
+The hexagon geometry is projected once per map projection and saved to a
+cache keyed on the hexagon shapes and the projection, so later runs can skip
+the reprojection. Figures are rendered with the non-interactive Agg backend,
+in a pool of worker processes which each receive the projected geometry once.
+
+A manifest next to the figures records a hash of the values and settings of
+each figure when it was last rendered, and figures whose hash has not changed
+since are not rendered again.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import astuple, dataclass
+
+import matplotlib
+import pandas as pd
+
+# projected hexagon geometry is cached in this folder-- set to None to always reproject
+cache_dir = 'Resources/map_cache'
+manifest_name = 'map_manifest.json'
+
+
+@dataclass(frozen=True)
+class MapFigure:
+    '''
+    a map of one hexagon column.
+    '''
+    column: str
+    title: str
+    label: str
+    filename: str
+    cmap: str = 'viridis_r'
+
+
+def _projection(central_longitude, central_latitude):
+    import cartopy.crs as ccrs
+    return ccrs.Orthographic(central_longitude=central_longitude, central_latitude=central_latitude)
+
+
+def _geometry_key(geometry, projection):
+    key = hashlib.sha256()
+    key.update(repr(list(geometry.index)).encode())
+    key.update(b''.join(geometry.to_wkb()))
+    key.update(projection.proj4_init.encode())
+    return key.hexdigest()
+
+
+def project_geometry(geometry, central_longitude, central_latitude):
+    '''
+    projects hexagon geometry to an orthographic map projection, or opens it
+    from the cache if it was projected before.
+
+    Parameters
+    ----------
+    geometry : geopandas GeoSeries
+        hexagon geometry.
+    central_longitude, central_latitude : float
+        centre of the projection in degrees.
+
+    Returns
+    -------
+    projected : geopandas GeoSeries
+        projected geometry.
+    key : string
+        hash of the geometry and projection.
+    '''
+    projection = _projection(central_longitude, central_latitude)
+    key = _geometry_key(geometry, projection)
+    if cache_dir is None:
+        return geometry.to_crs(projection.proj4_init), key
+    cache_path = os.path.join(cache_dir, f'geometry_{key}.pkl')
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as file:
+                return pickle.load(file), key
+        except (OSError, pickle.UnpicklingError, EOFError):
+            pass  # corrupt cache file, so project again
+    projected = geometry.to_crs(projection.proj4_init)
+    os.makedirs(cache_dir, exist_ok=True)
+    # write to a temporary file first so parallel runs never read a partial file
+    with open(f'{cache_path}.{os.getpid()}', 'wb') as file:
+        pickle.dump(projected, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f'{cache_path}.{os.getpid()}', cache_path)
+    return projected, key
+
+
+def _figure_hash(figure, values, geometry_key):
+    key = hashlib.sha256()
+    key.update(geometry_key.encode())
+    key.update(repr(astuple(figure)).encode())
+    key.update(pd.util.hash_pandas_object(values, index=True).to_numpy().tobytes())
+    return key.hexdigest()
+
+
+def _read_manifest(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(path, manifest):
+    with open(f'{path}.{os.getpid()}', 'w') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(f'{path}.{os.getpid()}', path)
+
+
+# projected geometry and map projection, set once in each worker process
+_worker_state = {}
+
+
+def _init_worker(geometry, central_longitude, central_latitude):
+    '''
+    receives the projected geometry once when each worker process starts.
+    '''
+    matplotlib.use('Agg')
+    _worker_state['geometry'] = geometry
+    _worker_state['projection'] = _projection(central_longitude, central_latitude)
+
+
+def _render(task):
+    '''
+    renders and saves one figure; run in the worker processes.
+
+    Parameters
+    ----------
+    task : tuple
+        MapFigure, pandas Series of values indexed by hexagon and path to
+        save the figure to.
+
+    Returns
+    -------
+    path : string
+        path of the saved figure.
+    '''
+    import matplotlib.pyplot as plt
+    figure, values, path = task
+    fig = plt.figure(figsize=(10,5))
+    ax = plt.axes(projection=_worker_state['projection'])
+    ax.set_axis_off()
+    _worker_state['geometry'].to_frame('geometry').assign(value=values).plot(
+        ax=ax,
+        column='value',
+        legend=True,
+        cmap=figure.cmap,
+        legend_kwds={'label': figure.label},
+        missing_kwds={
+            "color": "lightgrey",
+            "label": "Missing values",
+        },
+    )
+    ax.set_title(figure.title)
+    # write to a temporary file first so an interrupted run never leaves a partial figure
+    fig.savefig(f'{path}.{os.getpid()}', format='png', bbox_inches='tight')
+    plt.close(fig)
+    os.replace(f'{path}.{os.getpid()}', path)
+    return path
+
+
+def render_maps(hexagons, figures, central_longitude, central_latitude, output_dir, workers=1):
+    '''
+    saves a map of each figure, skipping figures whose values and settings
+    have not changed since they were last saved.
+
+    Parameters
+    ----------
+    hexagons : geopandas GeoDataFrame
+        hexagons, with the column of each figure.
+    figures : list
+        MapFigure of each map to save.
+    central_longitude, central_latitude : float
+        centre of the orthographic projection in degrees.
+    output_dir : string
+        folder to save figures in.
+    workers : int, optional
+        number of worker processes. Default is 1, which renders in this process.
+
+    Returns
+    -------
+    rendered : list
+        paths of figures which were saved.
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, manifest_name)
+    manifest = _read_manifest(manifest_path)
+    geometry, geometry_key = project_geometry(hexagons.geometry, central_longitude, central_latitude)
+
+    tasks = []
+    hashes = {}
+    for figure in figures:
+        path = os.path.join(output_dir, figure.filename)
+        hashes[path] = _figure_hash(figure, hexagons[figure.column], geometry_key)
+        if manifest.get(figure.filename) == hashes[path] and os.path.exists(path):
+            continue
+        tasks.append((figure, hexagons[figure.column], path))
+    print(f'Rendering {len(tasks)} of {len(figures)} maps; the others are unchanged.')
+    if not tasks:
+        return []
+
+    rendered = []
+    initargs = (geometry, central_longitude, central_latitude)
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)),
+                                 initializer=_init_worker,
+                                 initargs=initargs) as executor:
+            futures = [executor.submit(_render, task) for task in tasks]
+            for future in as_completed(futures):
+                rendered.append(future.result())
+                # record each figure as soon as it is saved, so an interrupted run keeps its progress
+                manifest[os.path.basename(rendered[-1])] = hashes[rendered[-1]]
+                _write_manifest(manifest_path, manifest)
+    else:
+        _init_worker(*initargs)
+        for task in tasks:
+            rendered.append(_render(task))
+            manifest[os.path.basename(rendered[-1])] = hashes[rendered[-1]]
+            _write_manifest(manifest_path, manifest)
+    return rendered
@@ -9,16 +9,28 @@ Includes code from Nicholas Salmon, University of Oxford, for optimizing
 hydrogen and ammonia plant capacity.
 """
 
-import atlite
-import geopandas as gpd
+import hexagon_io
 import pypsa
 import pandas as pd
+import parameters
 import p_auxiliary as aux
+import profiles
+import result_store
+import screening
+import solvers
+import spatial
+import time_aggregation
 from functions import CRF
 import numpy as np
+import contextlib
+import itertools
+import json
 import logging
 import time
+import os
 import warnings
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
 
 # Ignore all deprecation warnings and future warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
@@ -27,10 +39,14 @@ warnings.simplefilter(action='ignore', category=FutureWarning)
 logging.basicConfig(level=logging.ERROR)
 
 
+@lru_cache(maxsize=None)
 def demand_schedule(quantity, transport_excel_path, weather_excel_path, freq='H'):
     '''
     calculates hourly ammonia demand for truck shipment and pipeline transport.
 
+    Schedules are cached for each set of arguments, so the returned dataframes
+    are shared between callers and must not be modified.
+
     Parameters
     ----------
     quantity : float
@@ -49,14 +65,10 @@ def demand_schedule(quantity, transport_excel_path, weather_excel_path, freq='H'
     pipeline_hourly_demand_schedule : pandas DataFrame
         hourly demand profile for pipeline transport.
     '''
-    transport_parameters = pd.read_excel(transport_excel_path,
-                                         sheet_name='NH3',
-                                         index_col='Parameter'
-                                         ).squeeze('columns')
-    weather_parameters = pd.read_excel(weather_excel_path,
-                                       index_col='Parameters',
-                                       ).squeeze('columns')
-    truck_capacity = transport_parameters['Net capacity (kg NH3)']
+    weather_parameters = parameters.read_excel(weather_excel_path,
+                                               index_col='Parameters',
+                                               ).squeeze('columns')
+    truck_capacity = parameters.trucking_parameters(transport_excel_path).net_capacity
     start_date = weather_parameters['Start date']
     end_date = weather_parameters['End date (not inclusive)']
 
@@ -80,9 +92,55 @@ def demand_schedule(quantity, transport_excel_path, weather_excel_path, freq='H'
 
 
 # in the future, may want to make hexagons a class with different features
+# basis file of the last hexagon solved in this process and the solver which wrote it
+_last_basis = {}
+
+
+def _discard_basis():
+    path = _last_basis.pop('path', None)
+    _last_basis.pop('solver', None)
+    if path is not None and os.path.exists(path):
+        os.remove(path)
+
+
+@lru_cache(maxsize=None)
+def plant_template(design_path='Parameters/Basic_ammonia_plant'):
+    '''
+    builds the ammonia plant network from its CSV design.
+
+    The network is built once per process and re-parameterized for each
+    hexagon by optimize_ammonia_plant(), as constructing a PyPSA network
+    takes longer than updating one.
+
+    Parameters
+    ----------
+    design_path : string, optional
+        path to folder of plant component CSV files.
+
+    Returns
+    -------
+    n : pypsa Network
+        plant network with an ammonia demand load.
+    overnight_capital_costs : dict
+        capital costs of generators, links and stores before annualization.
+    '''
+    n = pypsa.Network(override_component_attrs=aux.create_override_components())
+    n.import_from_csv_folder(design_path)
+    n.add('Load',
+          'Ammonia demand',
+          bus='Ammonia',
+          )
+    n.links.loc['HydrogenCompression', 'marginal_cost'] = 0.0001  # Just stops pointless cycling through storage
+    overnight_capital_costs = {'generators': n.generators.capital_cost.copy(),
+                               'links': n.links.capital_cost.copy(),
+                               'stores': n.stores.capital_cost.copy()}
+    return n, overnight_capital_costs
+
+
 def optimize_ammonia_plant(wind_potential, pv_potential, demand_profile,
                            wind_max_capacity, pv_max_capacity,
-                           country_series, water_limit=None):
+                           country_series, water_limit=None, solver_threads=None, solver=None,
+                           warm_start=False, aggregation=None):
     '''
    Optimizes the size of green ammonia plant components based on renewable potential, ammonia demand, and country parameters.
 
@@ -93,11 +151,22 @@ def optimize_ammonia_plant(wind_potential, pv_potential, demand_profile,
     pv_potential : xarray DataArray
         1D dataarray of per-unit solar potential in hexagon.
     demand_profile : pandas DataFrame
-        hourly dataframe of ammonia demand in kg.
+        hourly dataframe of ammonia demand in kg. Not modified.
     country_series : pandas Series
         interest rate and lifetime information.
     water_limit : float
         annual limit on water available for electrolysis in hexagon, in cubic meters. Default is None.
+    solver_threads : int
+        maximum number of threads used by the solver. Default is None, which lets the solver decide.
+    solver : string
+        name of solver. Default is None, which uses solvers.solver_name.
+    warm_start : boolean
+        whether to start from the basis of the last hexagon solved in this process,
+        if the solver supports it. Default is False.
+    aggregation : dict
+        settings for time_aggregation.aggregate() to reduce the snapshots, e.g.
+        dict(method='typical periods', n_periods=12). Default is None, which
+        solves every snapshot of the demand profile.
 
     Returns
     -------
@@ -115,17 +184,40 @@ def optimize_ammonia_plant(wind_potential, pv_potential, demand_profile,
         optimal hydrogen storage capacity in MWh.
     nh3_storage: float
         optimal ammonia storage capacity in MWh.
+    hb_capacity: float
+        optimal Haber-Bosch capacity in MW of electricity input.
 
     '''
 
     # Set up network
-    # Import a generic network
-    n = pypsa.Network(override_component_attrs=aux.create_override_components())
+    # Reuse the plant network of this process
+    n, overnight_capital_costs = plant_template()
+
+    # Reduce the number of snapshots
+    series = pd.DataFrame({'wind': np.asarray(wind_potential),
+                           'solar': np.asarray(pv_potential),
+                           'demand': demand_profile['Demand'].to_numpy()},
+                          index=demand_profile.index)
+    reduced = None
+    if aggregation is not None:
+        reduced = time_aggregation.aggregate(series, **aggregation)
+        series = reduced.data
 
     # Set the time values for the network
-    n.set_snapshots(demand_profile.index)
-    demand_profile['weights'] = 8760 / len(n.snapshots)
-    n.snapshot_weightings = demand_profile['weights']
+    if not n.snapshots.equals(series.index):
+        n.set_snapshots(series.index)
+        # a basis only fits a problem with the same snapshots
+        _discard_basis()
+    if reduced is None:
+        n.snapshot_weightings = pd.Series(8760 / len(n.snapshots), index=n.snapshots)
+    else:
+        n.snapshot_weightings = reduced.weightings
+
+    # Import demand profile
+    # Note: All flows are in MW or MWh, conversions for hydrogen done using HHVs. Hydrogen HHV = 39.4 MWh/t
+    # Note: All flows are in MW or MWh, conversions for ammonia done using HHVs. Ammonia HHV = 6.25 MWh/t
+    # hydrogen_demand = pd.read_excel(demand_path,index_col = 0) # Excel file in kg hydrogen, convert to MWh
+    n.loads_t.p_set['Ammonia demand'] = series['demand'].to_numpy() / 1000 * 6.25
 
     # if a water limit is given, check if hydrogen demand can be met
     if water_limit != None:
@@ -146,51 +238,68 @@ def optimize_ammonia_plant(wind_potential, pv_potential, demand_profile,
             electrolyzer_capacity = np.nan
             battery_capacity = np.nan
             h2_storage = np.nan
-            return lcoa, wind_capacity, solar_capacity, electrolyzer_capacity, battery_capacity, h2_storage
-
-    # Import the design of the H2 plant into the network
-    n.import_from_csv_folder("Parameters/Basic_ammonia_plant")
+            nh3_storage = np.nan
+            hb_capacity = np.nan
+            return lcoa, wind_capacity, solar_capacity, electrolyzer_capacity, battery_capacity, h2_storage, \
+                nh3_storage, hb_capacity
 
-    # Import demand profile
-    # Note: All flows are in MW or MWh, conversions for hydrogen done using HHVs. Hydrogen HHV = 39.4 MWh/t
-    # Note: All flows are in MW or MWh, conversions for ammonia done using HHVs. Ammonia HHV = 6.25 MWh/t
-    # hydrogen_demand = pd.read_excel(demand_path,index_col = 0) # Excel file in kg hydrogen, convert to MWh
-    n.add('Load',
-          'Ammonia demand',
-          bus='Ammonia',
-          p_set=demand_profile['Demand'].to_numpy() / 1000 * 6.25,
-          )
     # Send the weather data to the model
-    n.generators_t.p_max_pu['Wind'] = wind_potential
-    n.generators_t.p_max_pu['Solar'] = pv_potential
+    n.generators_t.p_max_pu['Wind'] = series['wind'].to_numpy()
+    n.generators_t.p_max_pu['Solar'] = series['solar'].to_numpy()
 
     # specify maximum capacity based on land use
     n.generators.loc['Wind', 'p_nom_max'] = wind_max_capacity
     n.generators.loc['Solar', 'p_nom_max'] = pv_max_capacity
 
     # specify technology-specific and country-specific WACC and lifetime here
+    n.generators.capital_cost = overnight_capital_costs['generators'].copy()
     n.generators.loc['Wind', 'capital_cost'] = n.generators.loc['Wind', 'capital_cost'] \
                                                * CRF(country_series['Wind interest rate'],
                                                      country_series['Wind lifetime (years)'])
     n.generators.loc['Solar', 'capital_cost'] = n.generators.loc['Solar', 'capital_cost'] \
                                                 * CRF(country_series['Solar interest rate'],
                                                       country_series['Solar lifetime (years)'])
-    for item in [n.links, n.stores]:
-        item.capital_cost = item.capital_cost * CRF(country_series['Plant interest rate'],
-                                                    country_series['Plant lifetime (years)'])
-    n.links.loc['HydrogenCompression', 'marginal_cost'] = 0.0001  # Just stops pointless cycling through storage
+    for item, component in [(n.links, 'links'), (n.stores, 'stores')]:
+        item.capital_cost = overnight_capital_costs[component] * CRF(country_series['Plant interest rate'],
+                                                                     country_series['Plant lifetime (years)'])
 
     # Adjust the capital cost of the stores and the marginal costs based on temporal aggregation
     # n.stores.capital_cost *= 8760/len(n.snapshots)
     # n.links.marginal_cost *= 8760/len(n.snapshots)
 
     # Solve the model
-    solver = 'gurobi'
-    n.lopf(solver_name=solver,
-           solver_options={'LogToConsole': 0, 'OutputFlag': 0},
-           pyomo=True,
-           extra_functionality=aux.pyomo_constraints,
-           )
+    if solver is None:
+        solver = solvers.solver_name
+    warm_start = warm_start and solver in solvers.basis_solvers
+    start_basis = _last_basis.get('path') if warm_start and _last_basis.get('solver') == solver else None
+    # typical periods need their own storage and ramp constraints, and segments their own ramp constraints
+    if reduced is not None and reduced.periods is not None:
+        model = time_aggregation.typical_period_model(n, reduced)
+    elif reduced is not None:
+        model = time_aggregation.segment_model(n, reduced)
+    else:
+        model = contextlib.nullcontext(aux.extra_functionalities)
+    with model as extra_functionality, solvers.highs_reader():
+        status, termination_condition = n.lopf(solver_name=solver,
+                                               solver_options=solvers.solver_options(solver, solver_threads, warm_start),
+                                               solver_logfile=solvers.solver_logfile(),
+                                               pyomo=False,
+                                               extra_functionality=extra_functionality,
+                                               warmstart=start_basis or False,
+                                               store_basis=warm_start,
+                                               )
+    if warm_start:
+        _discard_basis()
+        basis_path = getattr(n, 'basis_fn', None)
+        if basis_path is not None and os.path.exists(basis_path):
+            if status == 'ok':
+                _last_basis.update(solver=solver, path=basis_path)
+            else:
+                os.remove(basis_path)
+    # the network is reused for the next hexagon, so results of a failed solve must not be read from it
+    if status != 'ok':
+        print(f'Optimization failed with {solver}: {termination_condition}')
+        return (np.nan,) * len(result_columns)
     # Output results
     lcoa = n.objective / ((n.loads_t.p_set['Ammonia demand'] * n.snapshot_weightings[
         'objective']).sum() / 6.25 * 1000)  # convert back to kg NH3
@@ -199,172 +308,497 @@ def optimize_ammonia_plant(wind_potential, pv_potential, demand_profile,
     electrolyzer_capacity = n.links.p_nom_opt['Electrolysis']
     battery_capacity = n.stores.e_nom_opt['Battery']
     h2_storage = n.stores.e_nom_opt['CompressedH2Store']
-    # !!! need to save ammonia storage capacity as well
     nh3_storage = n.stores.e_nom_opt['Ammonia']
+    hb_capacity = n.links.p_nom_opt['HB']
     print('LCOA: €' + str(lcoa) + '/kg NH3')
-    return lcoa, wind_capacity, solar_capacity, electrolyzer_capacity, battery_capacity, h2_storage, nh3_storage
+    return lcoa, wind_capacity, solar_capacity, electrolyzer_capacity, battery_capacity, h2_storage, nh3_storage, \
+        hb_capacity
 
 
 # set model frequency-- can downsample to reduce solve time
 
 freq = '3H'
+# atlite wind turbine and solar panel-- compare others with technology_sweep.py
+# Changed turbine type - was Vestas_V80_2MW_gridstreamer in first run
+# Other option being explored: NREL_ReferenceTurbine_2020ATB_4MW, Enercon_E126_7500kW
+turbine = 'NREL_ReferenceTurbine_2020ATB_4MW'
+panel = 'CSi'
+
+# number of worker processes used to optimize hexagons in parallel-- 1 solves in serial
+n_workers = 1
+# solver threads per worker-- keep n_workers*solver_threads at or below the number of cores
+solver_threads = 1
+# time each available solver on a few hexagons and use the fastest, instead of solvers.solver_name
+benchmark_solver = False
+benchmark_hexagons = 3
+# hexagons are solved along a space-filling curve, so that solvers which support it can start from the
+# basis of a neighbouring hexagon-- each worker solves chunks of this many neighbouring hexagons
+warm_start = True
+chunk_size = 8
+# reduce the snapshots of each hexagon after resampling to freq-- None solves every snapshot, otherwise
+# settings for time_aggregation.aggregate(), e.g. dict(method='typical periods', n_periods=12, period_hours=24)
+# or dict(method='segments', n_segments=730). Compare the results with time_aggregation_error.py.
+aggregation = None
+# skip hexagons which cannot compete-- the screening_seeds hexagons with the lowest bound on production and
+# transport cost are solved first, then hexagons whose bound is more than screening_threshold (as a fraction)
+# above the lowest cost found are skipped. Hexagons without enough land to meet demand are always skipped.
+# !!! skipped hexagons have no production cost, so they are missing from the total costs and maps, and the
+# bound leaves out water costs-- only turn this on when the cheapest hexagons are all that is needed
+screen_hexagons = False
+screening_seeds = 8
+screening_threshold = 0.5
 
 transport_excel_path = "Parameters/transport_parameters.xlsx"
 weather_excel_path = "Parameters/weather_parameters.xlsx"
 country_excel_path = 'Parameters/country_parameters.xlsx'
 technology_parameters = "Parameters/technology_parameters.xlsx"
-
-country_parameters = pd.read_excel(country_excel_path,
-                                   index_col='Country')
 demand_excel_path = 'Parameters/demand_parameters.xlsx'
-demand_parameters = pd.read_excel(demand_excel_path,
-                                  index_col='Demand center',
-                                  ).squeeze("columns")
-demand_centers = demand_parameters.index
-weather_parameters = pd.read_excel(weather_excel_path,
-                                   index_col='Parameters'
-                                   ).squeeze('columns')
-weather_filename = weather_parameters['Filename']
-global_data = pd.read_excel(technology_parameters,
-                            sheet_name='Global',
-                            index_col='Parameter'
-                            ).squeeze("columns")
-pipeline_construction = global_data['Pipeline construction allowed']
-
-# !!! can include water costs here instead of in water_cost.py
-# water_data = pd.read_excel(technology_parameters,
-#                             sheet_name='Water',
-#                             index_col='Parameter'
-#                             ).squeeze("columns")
-# water_spec_cost = water_data['Water specific cost (euros/m3)']
-
-hexagons = gpd.read_file('Resources/hex_transport.geojson')
-# !!! change to name of cutout in weather
-cutout = atlite.Cutout('Cutouts/' + weather_filename + '.nc')
-layout = cutout.uniform_layout()
-
-pv_profile = cutout.pv(
-    panel='CSi',
-    orientation='latitude_optimal',
-    layout=layout,
-    shapes=hexagons,
-    per_unit=True
-).resample(time=freq).mean()
-pv_profile = pv_profile.rename(dict(dim_0='hexagon'))
-
-wind_profile = cutout.wind(
-    # Changed turbine type - was Vestas_V80_2MW_gridstreamer in first run
-    # Other option being explored: NREL_ReferenceTurbine_2020ATB_4MW, Enercon_E126_7500kW
-    turbine='NREL_ReferenceTurbine_2020ATB_4MW',
-    layout=layout,
-    shapes=hexagons,
-    per_unit=True
-).resample(time=freq).mean()
-wind_profile = wind_profile.rename(dict(dim_0='hexagon'))
-
-for location in demand_centers:
-    lcoas_trucking = np.zeros(len(pv_profile.hexagon))
-    solar_capacities = np.zeros(len(pv_profile.hexagon))
-    wind_capacities = np.zeros(len(pv_profile.hexagon))
-    electrolyzer_capacities = np.zeros(len(pv_profile.hexagon))
-    battery_capacities = np.zeros(len(pv_profile.hexagon))
-    h2_storages = np.zeros(len(pv_profile.hexagon))
-    nh3_storages = np.zeros(len(pv_profile.hexagon))
-
-    print('Optimizing for trucking demand profile...')
-    start = time.process_time()
-    # function
-    for hexagon in pv_profile.hexagon.data:
-        ammonia_demand_trucking, ammonia_demand_pipeline = demand_schedule(
-            demand_parameters.loc[location, 'Annual demand [kg/a]'],
-            transport_excel_path,
-            weather_excel_path,
-            freq=freq)
-        country_series = country_parameters.loc[hexagons.country[hexagon]]
-        lcoa, wind_capacity, solar_capacity, electrolyzer_capacity, battery_capacity, h2_storage, nh3_storage = \
-            optimize_ammonia_plant(wind_profile.sel(hexagon=hexagon, time=ammonia_demand_trucking.index),
-                                   pv_profile.sel(hexagon=hexagon, time=ammonia_demand_trucking.index),
-                                   ammonia_demand_trucking,
-                                   hexagons.loc[hexagon, 'theo_turbines']*4, # using 4MW turbines
-                                   hexagons.loc[hexagon, 'theo_pv'],
-                                   country_series,
-                                   # water_limit = hexagons.loc[hexagon,'delta_water_m3']
-                                   )
-        lcoas_trucking[hexagon] = lcoa
-        solar_capacities[hexagon] = solar_capacity
-        wind_capacities[hexagon] = wind_capacity
-        electrolyzer_capacities[hexagon] = electrolyzer_capacity
-        battery_capacities[hexagon] = battery_capacity
-        h2_storages[hexagon] = h2_storage
-        nh3_storages[hexagon] = nh3_storage
-
-    trucking_time = time.process_time() - start
-
-    hexagons[f'{location} trucking solar capacity'] = solar_capacities
-    hexagons[f'{location} trucking wind capacity'] = wind_capacities
-    hexagons[f'{location} trucking electrolyzer capacity'] = electrolyzer_capacities
-    hexagons[f'{location} trucking battery capacity'] = battery_capacities
-    hexagons[f'{location} trucking H2 storage capacity'] = h2_storages
-    hexagons[f'{location} trucking NH3 storage capacity'] = nh3_storages
-    # save trucking lcoa
-    hexagons[f'{location} trucking production cost'] = lcoas_trucking
-
-    print('Trucking optimisation complete! Time elapsed: ' + str(trucking_time) + ' s')
-    if pipeline_construction == True:
-
-        # calculate cost of production for pipeline demand profile
-        lcoas_pipeline = np.zeros(len(pv_profile.hexagon))
-        solar_capacities = np.zeros(len(pv_profile.hexagon))
-        wind_capacities = np.zeros(len(pv_profile.hexagon))
-        electrolyzer_capacities = np.zeros(len(pv_profile.hexagon))
-        battery_capacities = np.zeros(len(pv_profile.hexagon))
-        h2_storages = np.zeros(len(pv_profile.hexagon))
-        nh3_storages = np.zeros(len(pv_profile.hexagon))
-        print('Optimizing for pipeline demand profile...')
-        start = time.process_time()
-        for hexagon in pv_profile.hexagon.data:
-            ammonia_demand_trucking, ammonia_demand_pipeline = demand_schedule(
-                demand_parameters.loc[location, 'Annual demand [kg/a]'],
-                transport_excel_path,
-                weather_excel_path,
-                freq=freq)
-            country_series = country_parameters.loc[hexagons.country[hexagon]]
-            lcoa, wind_capacity, solar_capacity, electrolyzer_capacity, battery_capacity, h2_storage, nh3_storage = \
-                optimize_ammonia_plant(wind_profile.sel(hexagon=hexagon, time=ammonia_demand_pipeline.index),
-                                       pv_profile.sel(hexagon=hexagon, time=ammonia_demand_pipeline.index),
-                                       ammonia_demand_pipeline,
-                                       hexagons.loc[hexagon, 'theo_turbines']*4, # using 4 MW turbines
-                                       hexagons.loc[hexagon, 'theo_pv'],
-                                       country_series,
-                                       # water_limit = hexagons.loc[hexagon,'delta_water_m3'],
-                                       )
-            lcoas_pipeline[hexagon] = lcoa
-            solar_capacities[hexagon] = solar_capacity
-            wind_capacities[hexagon] = wind_capacity
-            electrolyzer_capacities[hexagon] = electrolyzer_capacity
-            battery_capacities[hexagon] = battery_capacity
-            h2_storages[hexagon] = h2_storage
-            nh3_storages[hexagon] = nh3_storage
-    else:
-        solar_capacities = np.empty(len(hexagons)).fill(np.nan)
-        wind_capacities = np.empty(len(hexagons)).fill(np.nan)
-        electrolyzer_capacities = np.empty(len(hexagons)).fill(np.nan)
-        battery_capacities = np.empty(len(hexagons)).fill(np.nan)
-        h2_storages = np.empty(len(hexagons)).fill(np.nan)
-        nh3_storages = np.empty(len(hexagons)).fill(np.nan)
+# results are saved here as each hexagon is solved so interrupted runs can be restarted-- results of demand
+# centers whose row in demand_parameters or whose settings above change are deleted automatically. pipeline.py
+# also clears results after changes to other inputs; when running this script directly, delete this file after
+# changing other inputs (e.g. the cutout or parameter workbooks) so that all hexagons are re-solved
+result_store_path = 'Resources/hex_lcoa_results.sqlite'
+# only optimize demand centers which were added or changed since the hexagon file was saved, and keep the
+# columns of the others-- the inputs of each demand center are saved next to the hexagon file
+incremental = True
+provenance_path = hexagon_io.stage_path('hex_lcoa', 'provenance.json')
+
+# results of optimize_ammonia_plant(), in the order they are returned
+result_columns = ['production cost',
+                  'wind capacity',
+                  'solar capacity',
+                  'electrolyzer capacity',
+                  'battery capacity',
+                  'H2 storage capacity',
+                  'NH3 storage capacity',
+                  'HB capacity',
+                  ]
+
+
+# demand schedules keyed by (demand center, transport mode), shared read-only with the workers
+_demand_schedules = {}
+
+
+def _init_worker(demand_schedules):
+    '''
+    receives the demand schedules once when each worker process starts.
+    '''
+    _demand_schedules.update(demand_schedules)
+    # load the plant design
+    plant_template()
 
-    pipeline_time = time.process_time() - start
-    print('Pipeline optimisation complete! Time elapsed: ' + str(pipeline_time) + ' s')
 
-    hexagons[f'{location} pipeline solar capacity'] = solar_capacities
-    hexagons[f'{location} pipeline wind capacity'] = wind_capacities
-    hexagons[f'{location} pipeline electrolyzer capacity'] = electrolyzer_capacities
-    hexagons[f'{location} pipeline battery capacity'] = battery_capacities
-    hexagons[f'{location} pipeline H2 storage capacity'] = h2_storages
-    hexagons[f'{location} pipeline NH3 storage capacity'] = nh3_storages
+def _optimize_hexagon(task):
+    '''
+    optimizes the ammonia plant in a single hexagon; run in the worker processes.
 
-    # add optimal lcoa for each hexagon to hexagon file
-    hexagons[f'{location} pipeline production cost'] = lcoas_pipeline
+    Parameters
+    ----------
+    task : tuple
+        hexagon index, key of the demand schedule in _demand_schedules and
+        dictionary of other keyword arguments for optimize_ammonia_plant().
 
-hexagons.to_file('Resources/hex_lcoa.geojson', driver='GeoJSON', encoding='utf-8')
+    Returns
+    -------
+    hexagon : int
+        hexagon index.
+    results : tuple
+        results of optimize_ammonia_plant().
+    '''
+    hexagon, schedule_key, kwargs = task
+    return hexagon, optimize_ammonia_plant(demand_profile=_demand_schedules[schedule_key], **kwargs)
 
+
+def _optimize_chunk(tasks):
+    '''
+    optimizes the ammonia plant in a chunk of neighbouring hexagons in turn; run in the worker processes.
+    '''
+    return [_optimize_hexagon(task) for task in tasks]
+
+
+def optimize_hexagons(tasks, executor=None, max_pending=None, chunk_size=None):
+    '''
+    optimizes the ammonia plant in each hexagon, in parallel if an executor is given.
+
+    Results are yielded as soon as each hexagon is solved, so may not be in
+    the same order as the tasks.
+
+    Parameters
+    ----------
+    tasks : iterable
+        (hexagon, demand schedule key, keyword arguments) tuples for optimize_ammonia_plant().
+    executor : concurrent.futures.Executor, optional
+        pool of worker processes. Default is None, which solves in serial.
+    max_pending : int, optional
+        maximum number of chunks submitted at once, which bounds the memory
+        used by queued weather profiles. Default is four per worker.
+    chunk_size : int, optional
+        number of consecutive tasks solved in turn by one worker. Default is
+        the module chunk_size.
+
+    Yields
+    ------
+    hexagon : int
+        hexagon index.
+    results : tuple
+        results of optimize_ammonia_plant().
+    '''
+    if executor is None:
+        yield from map(_optimize_hexagon, tasks)
+        return
+    if max_pending is None:
+        max_pending = 4 * n_workers
+    if chunk_size is None:
+        chunk_size = globals()['chunk_size']
+    tasks = iter(tasks)
+    pending = set()
+    for chunk in iter(lambda: list(itertools.islice(tasks, chunk_size)), []):
+        if len(pending) >= max_pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+        pending.add(executor.submit(_optimize_chunk, chunk))
+    for future in as_completed(pending):
+        yield from future.result()
+
+
+def renewable_profiles(hexagons, weather_filename):
+    '''
+    opens the per-unit wind and solar potential in each hexagon, converting
+    the cutout only if the profiles are not in the cache.
+
+    Parameters
+    ----------
+    hexagons : geopandas GeoDataFrame
+        hexagons.
+    weather_filename : string
+        name of the atlite cutout in the Cutouts folder, without extension.
+
+    Returns
+    -------
+    wind_profile : xarray DataArray
+        per-unit wind potential at the resolution of the cutout, with hexagon
+        and time dimensions. Use profiles.hexagon_profile() to read a hexagon.
+    pv_profile : xarray DataArray
+        per-unit solar potential, as for wind.
+    '''
+    # !!! change to name of cutout in weather
+    cutout_path = 'Cutouts/' + weather_filename + '.nc'
+    cubes = profiles.profile_cubes(cutout_path, hexagons, {
+        'wind': ('wind', dict(turbine=turbine)),
+        'pv': ('pv', dict(panel=panel, orientation='latitude_optimal')),
+    })
+    wind_profile, pv_profile = cubes['wind'], cubes['pv']
+    return wind_profile, pv_profile
+
+
+def plant_column_names(location):
+    '''
+    names of the hexagon columns saved for a demand center.
+    '''
+    return [f'{location} {transport} {column}' for transport in ['trucking', 'pipeline']
+            for column in result_columns + ['screening']]
+
+
+def result_inputs(demand_center_parameters, weather_filename):
+    '''
+    inputs the results of a demand center depend on, as a JSON string.
+
+    Parameters
+    ----------
+    demand_center_parameters : pandas Series
+        row of the demand parameters for the demand center.
+    weather_filename : string
+        name of the atlite cutout.
+    '''
+    return json.dumps({'demand center': json.loads(demand_center_parameters.to_json()),
+                       'settings': dict(freq=freq,
+                                        turbine=turbine,
+                                        panel=panel,
+                                        aggregation=aggregation,
+                                        weather=weather_filename)},
+                      sort_keys=True)
+
+
+def read_provenance():
+    '''
+    reads the inputs of each demand center in the saved "hex_lcoa" hexagon file.
+
+    Returns
+    -------
+    provenance : dict
+        inputs keyed by demand center, which is empty if there is no saved file.
+    '''
+    if not os.path.exists(hexagon_io.stage_path('hex_lcoa')):
+        return {}
+    try:
+        with open(provenance_path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_provenance(provenance):
+    # write to a temporary file first so an interrupted run never leaves a partial file
+    with open(f'{provenance_path}.{os.getpid()}', 'w') as file:
+        json.dump(provenance, file, indent=1, sort_keys=True)
+    os.replace(f'{provenance_path}.{os.getpid()}', provenance_path)
+
+
+def clear_results(demand_centers):
+    '''
+    deletes the stored results of demand centers so that all their hexagons are
+    re-solved, and marks their columns in the hexagon file as out of date.
+    '''
+    provenance = read_provenance()
+    if any(location in provenance for location in demand_centers):
+        _write_provenance({location: inputs for location, inputs in provenance.items()
+                           if location not in demand_centers})
+    if not os.path.exists(result_store_path):
+        return
+    store = result_store.open_result_store(result_store_path, result_columns)
+    try:
+        for location in demand_centers:
+            result_store.clear_results(store, location)
+    finally:
+        store.close()
+
+
+def main(demand_centers=None):
+    '''
+    optimizes the ammonia plant in each hexagon for each demand center and
+    transport mode, and saves the results as the "hex_lcoa" hexagon file.
+
+    Parameters
+    ----------
+    demand_centers : list, optional
+        demand centers to optimize. The columns and stored results of other
+        demand centers are kept as they are, along with the inputs they were
+        solved with, so changed ones are optimized by a later run. Default
+        is None, which optimizes the demand centers added or changed since
+        the file was saved if incremental is True, or all demand centers
+        otherwise.
+    '''
+    country_parameters = parameters.read_excel(country_excel_path,
+                                               index_col='Country')
+    demand_parameters = parameters.read_excel(demand_excel_path,
+                                              index_col='Demand center',
+                                              ).squeeze("columns")
+    weather_parameters = parameters.read_excel(weather_excel_path,
+                                               index_col='Parameters'
+                                               ).squeeze('columns')
+    weather_filename = weather_parameters['Filename']
+
+    # inputs of each demand center, saved with its stored results and with its columns in the hexagon file
+    inputs = {location: result_inputs(demand_parameters.loc[location], weather_filename)
+              for location in demand_parameters.index}
+    provenance = {location: {'results': inputs[location],
+                             'screening': [screen_hexagons, screening_seeds, screening_threshold]}
+                  for location in demand_parameters.index}
+    previous = read_provenance()
+    if demand_centers is not None:
+        demand_centers = pd.Index(demand_centers)
+    elif incremental:
+        demand_centers = pd.Index([location for location in demand_parameters.index
+                                   if previous.get(location) != provenance[location]])
+        removed = [location for location in previous if location not in provenance]
+        print(f'Optimizing {len(demand_centers)} added or changed demand centers {list(demand_centers)}; '
+              f'keeping {len(demand_parameters) - len(demand_centers)} unchanged and dropping {len(removed)} removed.')
+    else:
+        demand_centers = demand_parameters.index
+    global_data = parameters.read_excel(technology_parameters,
+                                        sheet_name='Global',
+                                        index_col='Parameter'
+                                        ).squeeze("columns")
+    pipeline_construction = global_data['Pipeline construction allowed']
+
+    # !!! can include water costs here instead of in water_cost.py
+    # water_data = pd.read_excel(technology_parameters,
+    #                             sheet_name='Water',
+    #                             index_col='Parameter'
+    #                             ).squeeze("columns")
+    # water_spec_cost = water_data['Water specific cost (euros/m3)']
+
+    transport_cost_columns = []
+    for location in demand_centers:
+        transport_cost_columns += [f'{location} road construction costs',
+                                   f'{location} trucking transport costs',
+                                   f'{location} pipeline transport costs']
+    hexagons = hexagon_io.read_hexagons('hex_transport',
+                                        columns=['country', 'theo_turbines', 'theo_pv'] + transport_cost_columns)
+    wind_max_capacity = hexagons['theo_turbines']*profiles.turbine_capacity(turbine)
+    wind_profile, pv_profile = renewable_profiles(hexagons, weather_filename)
+
+    transport_modes = ['trucking', 'pipeline']
+
+    # demand schedules only depend on the demand center, so are calculated once here
+    for location in demand_centers:
+        ammonia_demand_trucking, ammonia_demand_pipeline = demand_schedule(
+            demand_parameters.loc[location, 'Annual demand [kg/a]'],
+            transport_excel_path,
+            weather_excel_path,
+            freq=freq)
+        _demand_schedules[(location, 'trucking')] = ammonia_demand_trucking
+        _demand_schedules[(location, 'pipeline')] = ammonia_demand_pipeline
+
+    # ammonia produced in the demand hexagon is not transported, so it is delivered continuously
+    demand_hexagons = spatial.demand_hexagons(hexagons, demand_parameters)
+
+    # neighbouring hexagons have similar solutions, so are solved one after another
+    hexagon_order = spatial.hilbert_order(hexagons)
+
+    def hexagon_tasks(location, transport, solved, order=hexagon_order, skip=None):
+        for hexagon in order:
+            if hexagon in solved or (skip is not None and skip(hexagon)):
+                continue
+            schedule_key = (location, 'pipeline') if hexagon == demand_hexagons[location] else (location, transport)
+            times = _demand_schedules[schedule_key].index
+            yield hexagon, schedule_key, dict(
+                wind_potential=profiles.hexagon_profile(wind_profile, hexagon, times),
+                pv_potential=profiles.hexagon_profile(pv_profile, hexagon, times),
+                wind_max_capacity=wind_max_capacity[hexagon],
+                pv_max_capacity=hexagons.loc[hexagon, 'theo_pv'],
+                country_series=country_parameters.loc[hexagons.country[hexagon]],
+                # water_limit = hexagons.loc[hexagon,'delta_water_m3'],
+                solver_threads=solver_threads,
+                solver=solver,
+                warm_start=warm_start,
+                aggregation=aggregation,
+            )
+
+    template, overnight_capital_costs = plant_template()
+    wind_crf = screening.country_crf(hexagons.country, country_parameters, 'Wind')
+    pv_crf = screening.country_crf(hexagons.country, country_parameters, 'Solar')
+    plant_crf = screening.country_crf(hexagons.country, country_parameters, 'Plant')
+
+    # mean potential of each hexagon over the snapshots of a demand schedule, read once for each time range
+    capacity_factors = {}
+
+    def cost_bound(location, transport):
+        '''
+        lower bound on production and transport cost per kg ammonia in each hexagon.
+        '''
+        bounds = {}
+        for mode in {transport, 'pipeline'}:
+            times = _demand_schedules[(location, mode)].index
+            ammonia_demand = _demand_schedules[(location, mode)]['Demand'].mean() / 1000 * 6.25 * 8760
+            if (times[0], times[-1]) not in capacity_factors:
+                capacity_factors[(times[0], times[-1])] = (profiles.mean_profile(wind_profile, times),
+                                                           profiles.mean_profile(pv_profile, times))
+            wind_cf, pv_cf = capacity_factors[(times[0], times[-1])]
+            bounds[mode] = screening.production_cost_bound(template, overnight_capital_costs, ammonia_demand,
+                                                           wind_cf, pv_cf, wind_max_capacity, hexagons['theo_pv'],
+                                                           wind_crf, pv_crf, plant_crf)
+        production_bound = np.where(hexagons.index == demand_hexagons[location], bounds['pipeline'], bounds[transport])
+        if transport == 'trucking':
+            transport_costs = hexagons[f'{location} road construction costs'] \
+                + hexagons[f'{location} trucking transport costs']
+        else:
+            transport_costs = hexagons[f'{location} pipeline transport costs']
+        # transport costs are missing where a mode is not possible, so are left out of the bound there
+        return production_bound + transport_costs.fillna(0.), transport_costs
+
+    solver = solvers.solver_name
+    if benchmark_solver and len(demand_centers):
+        sample = list(itertools.islice(hexagon_tasks(demand_centers[0], transport_modes[0], set()), benchmark_hexagons))
+        solver, timings = solvers.benchmark_solvers(
+            lambda task, name: _optimize_hexagon((task[0], task[1], dict(task[2], solver=name)))[1][0],
+            sample)
+        print(f'Solver benchmark times (s): {timings}. Using {solver}.')
+
+    plant_columns = pd.DataFrame(index=hexagons.index)
+    store = result_store.open_result_store(result_store_path, result_columns)
+    # results solved with other inputs are deleted, including those of demand centers no longer in the table,
+    # while those of other demand centers in the table are kept until they are optimized
+    for location, stored_inputs in result_store.load_provenance(store).items():
+        if (location in demand_centers or location not in inputs) and inputs.get(location) != stored_inputs:
+            result_store.clear_results(store, location)
+    stored_inputs = result_store.load_provenance(store)
+    for location in demand_centers:
+        if location not in stored_inputs:
+            # results saved without their inputs can't be checked, so are re-solved
+            result_store.clear_results(store, location)
+            result_store.record_provenance(store, location, inputs[location])
+    executor = None
+    if n_workers > 1:
+        # stop numerical libraries in the workers from starting a thread per core
+        for variable in ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS']:
+            os.environ[variable] = str(solver_threads)
+        executor = ProcessPoolExecutor(max_workers=n_workers,
+                                       initializer=_init_worker,
+                                       initargs=(_demand_schedules,))
+
+    try:
+        for location in demand_centers:
+            for transport in transport_modes:
+                if transport == 'pipeline' and pipeline_construction != True:
+                    for column in result_columns:
+                        plant_columns[f'{location} pipeline {column}'] = np.nan
+                    continue
+
+                solved = result_store.solved_hexagons(store, location, transport)
+                if solved:
+                    print(f'Skipping {len(solved)} hexagons already optimized for {transport}.')
+                print(f'Optimizing for {transport} demand profile...')
+                start = time.perf_counter()
+                bound, transport_costs = cost_bound(location, transport)
+                results = result_store.load_results(store, location, transport, result_columns)
+                # lowest production and transport cost found so far, which is updated as hexagons are solved
+                lowest_cost = [(results['production cost'] + transport_costs.reindex(results.index)).min()]
+                if not np.isfinite(lowest_cost[0]):
+                    lowest_cost[0] = np.inf
+                phases = [(hexagon_order, None)]
+                if screen_hexagons:
+                    # seeds are hexagons from which this transport mode is possible
+                    candidates = bound[np.isfinite(bound) & transport_costs.notna()]
+                    seeds = candidates.nsmallest(screening_seeds).index
+                    phases = [(seeds, None),
+                              (hexagon_order.difference(seeds, sort=False),
+                               lambda hexagon: np.isinf(bound[hexagon])
+                               or bound[hexagon] > lowest_cost[0] * (1 + screening_threshold))]
+                for order, skip in phases:
+                    for hexagon, result in optimize_hexagons(hexagon_tasks(location, transport, solved, order, skip),
+                                                             executor):
+                        result_store.record_result(store, location, transport, hexagon, result, result_columns)
+                        solved.add(hexagon)
+                        if np.isfinite(result[0]):
+                            lowest_cost[0] = min(lowest_cost[0], result[0] + transport_costs[hexagon])
+                elapsed = time.perf_counter() - start
+                print(f'{transport.capitalize()} optimisation complete! Time elapsed: ' + str(elapsed) + ' s')
+
+                # assemble columns from the result store so resumed runs include earlier results
+                results = result_store.load_results(store, location, transport, result_columns)
+                results = results.reindex(hexagons.index)
+                for column in ['solar capacity', 'wind capacity'] + result_columns[3:]:
+                    plant_columns[f'{location} {transport} {column}'] = results[column]
+                # save optimal lcoa for each hexagon to hexagon file
+                plant_columns[f'{location} {transport} production cost'] = results['production cost']
+                # record which hexagons were skipped by screening
+                status = np.where(hexagons.index.isin(solved),
+                                  'solved',
+                                  np.where(np.isinf(bound), 'infeasible', 'uncompetitive'))
+                plant_columns[f'{location} {transport} screening'] = pd.Categorical(
+                    status, categories=['solved', 'uncompetitive', 'infeasible'])
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        store.close()
+
+    unchanged = demand_parameters.index.difference(demand_centers, sort=False)
+    if len(unchanged):
+        # results of other demand centers are kept from the previous run
+        saved_columns = hexagon_io.column_names('hex_lcoa')
+        plant_columns = plant_columns.join(hexagon_io.read_hexagons(
+            'hex_lcoa',
+            columns=[column for location in unchanged for column in plant_column_names(location)
+                     if column in saved_columns],
+            geometry=False))
+    hexagon_io.add_columns('hex_transport', 'hex_lcoa', plant_columns)
+    # columns copied from the previous run keep the inputs they were solved with, so changed ones are solved later
+    _write_provenance({location: provenance[location] if location in demand_centers else previous[location]
+                       for location in demand_parameters.index
+                       if location in demand_centers or location in previous})
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,10 @@
 import pypsa
+from pypsa.linopt import get_var, linexpr, define_constraints
 import numpy as np
 import pyomo.environ as pm
 import logging
 import pandas as pd
-
-# !!! define time step in hours here
-timestep = 3
+import solvers
 
 def create_override_components():
     """Set up new component attributes as required"""
@@ -294,22 +293,91 @@ def get_results_dict_for_multi_site(n, aggregation_count=1, operating=False, tim
     return dct
 
 
-def extra_functionalities(n, snapshots):
-    """Could be added later if you wanted to convert the pyomo constraints to linopt, but this is a pain."""
-    pass
+def snapshot_duration(snapshots):
+    """Resolution of the snapshots in hours: the shortest time between consecutive snapshots, or the frequency of
+    the index if there is only one snapshot. Segments may join every snapshot with its neighbours, so give the
+    resolution of aggregated snapshots from time_aggregation.Aggregation.hours instead."""
+    if len(snapshots) > 1:
+        return pd.Series(snapshots).diff().min() / pd.Timedelta(hours=1)
+    if getattr(snapshots, 'freq', None) is None:
+        raise ValueError('The resolution of a single snapshot without a frequency is unknown.')
+    return pd.Timedelta(snapshots.freq) / pd.Timedelta(hours=1)
 
-# !!! need to manually change timedelta here when resampling
 
-def _nh3_ramp_down(model, t):
-    """Places a cap on how quickly the ammonia plant can ramp down"""
-    # if t == 0:
-    if t == model.t.at(1):
+def _hb_first_and_last(n, snapshots):
+    """HB output variables in the first and last snapshot, indexed by link"""
+    link_p = get_var(n, 'Link', 'p')
+    return link_p.loc[snapshots[0], ['HB']], link_p.loc[snapshots[-1], ['HB']].to_numpy()
 
-        old_rate = model.link_p['HB', model.t.at(-1)]
-    else:
-        # old_rate = model.link_p['HB', t - 1]
-        old_rate = model.link_p['HB', t - pd.Timedelta(timestep, unit = 'H')]
 
+def extra_functionalities(n, snapshots, previous=None, ramp_limits=None, ramp_scale=None, duration=None):
+    """The constraints of pyomo_constraints, written as arrays for PyPSA's linopt formulation (pyomo=False):
+    i) Battery sizing
+    ii) Hydrogen storage cycling limit
+    iii) Ramp hard constraints down and up from the last to the first snapshot
+    The cycling limit (ii) depends on the duration of a snapshot in hours, which is read from the spacing of the
+    snapshots unless duration is given, e.g. for segments.
+    PyPSA already limits ramping of links with a ramp_limit_up or ramp_limit_down between consecutive snapshots,
+    so (iii) only adds the ramp across the end of the year, which makes the HB ramp constraints cyclic.
+    If previous (the position of the snapshot before each snapshot) is given, (iii) limits the HB ramp between
+    every snapshot and its previous one instead, e.g. within each typical period. PyPSA's ramp limits must then be
+    switched off, and ramp_limits gives the ramp limits of the links.
+    Ramp limits are a fraction of capacity per snapshot, so assume snapshots of equal duration. For snapshots of
+    varying duration, e.g. segments, ramp_scale gives the time from each previous snapshot in snapshots of the
+    model resolution, which multiplies the ramp limits."""
+    link_p_nom = get_var(n, 'Link', 'p_nom')
+    store_e_nom = get_var(n, 'Store', 'e_nom')
+
+    # The battery constraint
+    lhs = linexpr((1, link_p_nom[['BatteryInterfaceIn']]),
+                  (-1 / n.links.efficiency['BatteryInterfaceOut'], link_p_nom[['BatteryInterfaceOut']].to_numpy()))
+    define_constraints(n, lhs, '=', 0, 'Link', 'battery_interface')
+
+    # Constrain the maximum discharge of the H2 storage relative to its size
+    # discharge over one snapshot of duration hours, with a factor 0.5 for oversized storage
+    if duration is None:
+        duration = snapshot_duration(snapshots)
+    time_step_cycle = 4/8760*duration*0.5
+    lhs = linexpr((1, link_p_nom[['BatteryInterfaceOut']]),
+                  (-time_step_cycle, store_e_nom[['CompressedH2Store']].to_numpy()))
+    define_constraints(n, lhs, '=', 0, 'Link', 'cycling_limit')
+
+    # The HB ramp constraints across the end of the year
+    logging.warning('Pypsa has been overridden - Ramp rates on NH3 plant are included')
+    hb_p_nom = link_p_nom[['HB']].to_numpy()
+    if previous is not None:
+        hb_p = get_var(n, 'Link', 'p').loc[snapshots, ['HB']]
+        hb_previous = hb_p.to_numpy()[previous]
+        scale = 1. if ramp_scale is None else np.asarray(ramp_scale)[:, np.newaxis]
+        lhs = linexpr((-1, hb_p), (1, hb_previous), (-ramp_limits.at['HB', 'ramp_limit_down'] * scale, hb_p_nom))
+        # named after the HB rather than the links, as PyPSA would keep the values of constraints over snapshots
+        # with the links, which have different snapshots for each hexagon
+        define_constraints(n, lhs, '<=', 0, 'HB', 'ramp_down')
+        lhs = linexpr((1, hb_p), (-1, hb_previous), (-ramp_limits.at['HB', 'ramp_limit_up'] * scale, hb_p_nom))
+        define_constraints(n, lhs, '<=', 0, 'HB', 'ramp_up')
+        return
+    first, last = _hb_first_and_last(n, snapshots)
+    lhs = linexpr((-1, first), (1, last), (-n.links.at['HB', 'ramp_limit_down'], hb_p_nom))
+    define_constraints(n, lhs, '<=', 0, 'Link', 'HB_cyclic_ramp_down')
+    lhs = linexpr((1, first), (-1, last), (-n.links.at['HB', 'ramp_limit_up'], hb_p_nom))
+    define_constraints(n, lhs, '<=', 0, 'Link', 'HB_cyclic_ramp_up')
+
+
+def extra_operating_functionalities(n, snapshots):
+    """Exactly as per extra_functionalities, but excludes any constraints which only apply during design"""
+    logging.warning('Pypsa has been overridden - Ramp rates on NH3 plant are included')
+    first, last = _hb_first_and_last(n, snapshots)
+    hb_capacity = n.links.at['HB', 'p_nom']
+    lhs = linexpr((-1, first), (1, last))
+    define_constraints(n, lhs, '<=', n.links.at['HB', 'ramp_limit_down'] * hb_capacity, 'Link', 'HB_cyclic_ramp_down')
+    lhs = linexpr((1, first), (-1, last))
+    define_constraints(n, lhs, '<=', n.links.at['HB', 'ramp_limit_up'] * hb_capacity, 'Link', 'HB_cyclic_ramp_up')
+
+
+def _nh3_ramp_down(model, t):
+    """Places a cap on how quickly the ammonia plant can ramp down"""
+    # the snapshot before the first is the last, so the ramp limit is cyclic
+    old_rate = model.link_p['HB', model.t.prevw(t)]
     return old_rate - model.link_p['HB', t] <= \
         model.link_p_nom['HB'] * model.HB_max_ramp_down
     # Note 20 is the UB of the size of the ammonia plant; essentially if x = 0 then the constraint is not active
@@ -317,28 +385,16 @@ def _nh3_ramp_down(model, t):
 
 def _nh3_ramp_up(model, t):
     """Places a cap on how quickly the ammonia plant can ramp down"""
-    # if t == 0:
-    if t == model.t.at(1):
-        old_rate = model.link_p['HB', model.t.at(-1)]
-    else:
-        # old_rate = model.link_p['HB', t - 1]
-        old_rate = model.link_p['HB', t - pd.Timedelta(timestep, unit = 'H')]
-
-
+    # the snapshot before the first is the last, so the ramp limit is cyclic
+    old_rate = model.link_p['HB', model.t.prevw(t)]
     return model.link_p['HB', t] - old_rate <= \
         model.link_p_nom['HB'] * model.HB_max_ramp_up
 
 
 def _nh3_ramp_down_operating(model, t):
     """Places a cap on how quickly the ammonia plant can ramp down"""
-    # if t == 0:
-    if t == model.t.at(1):
-        old_rate = model.link_p['HB', model.t.at(-1)]
-    else:
-        # old_rate = model.link_p['HB', t - 1]
-        old_rate = model.link_p['HB', t - pd.Timedelta(timestep, unit = 'H')]
-
-
+    # the snapshot before the first is the last, so the ramp limit is cyclic
+    old_rate = model.link_p['HB', model.t.prevw(t)]
     return old_rate - model.link_p['HB', t] <= \
         model.HB_capacity * model.HB_max_ramp_down
     # Note 20 is the UB of the size of the ammonia plant; essentially if x = 0 then the constraint is not active
@@ -346,14 +402,8 @@ def _nh3_ramp_down_operating(model, t):
 
 def _nh3_ramp_up_operating(model, t):
     """Places a cap on how quickly the ammonia plant can ramp down"""
-    # if t == 0:
-    if t == model.t.at(1):
-        old_rate = model.link_p['HB', model.t.at(-1)]
-    else:
-        # old_rate = model.link_p['HB', t - 1]
-        old_rate = model.link_p['HB', t - pd.Timedelta(timestep, unit = 'H')]
-
-
+    # the snapshot before the first is the last, so the ramp limit is cyclic
+    old_rate = model.link_p['HB', model.t.prevw(t)]
     return model.link_p['HB', t] - old_rate <= \
         model.HB_capacity * model.HB_max_ramp_up
 
@@ -361,26 +411,14 @@ def _nh3_ramp_up_operating(model, t):
 
 def _penalise_ramp_down(model, t):
     """Places a cap on how quickly the ammonia plant can ramp down"""
-    if t == model.t.at(1):
-    # if t == 0:
-        old_rate = model.link_p['HB', model.t.at(-1)]
-    else:
-        # old_rate = model.link_p['HB', t - 1]
-        old_rate = model.link_p['HB', t - pd.Timedelta(1, unit = 'H')]
-
+    old_rate = model.link_p['HB', model.t.prevw(t)]
 
     return model.link_p['PenaltyLink', t] >= (old_rate - model.link_p['HB', t])
 
 
 def _penalise_ramp_up(model, t):
     """Places a cap on how quickly the ammonia plant can ramp down"""
-    if t == model.t.at(1):
-    # if t == 0:
-        old_rate = model.link_p['HB', model.t.at(-1)]
-    else:
-        # old_rate = model.link_p['HB', t - 1]
-        old_rate = model.link_p['HB', t - pd.Timedelta(1, unit = 'H')]
-
+    old_rate = model.link_p['HB', model.t.prevw(t)]
 
     return model.link_p['PenaltyLink', t] >= (model.link_p['HB', t] - old_rate)
 
@@ -393,7 +431,9 @@ def pyomo_constraints(network, snapshots):
     iv) Ramp soft constraints down
     v) Ramp soft constraints up
     (iv) and (v) just softly suppress ramping so that the model doesn't 'zig-zag', which looks a bit odd on operation.
-    Makes very little difference on LCOA. """
+    Makes very little difference on LCOA.
+    The ramp limits are per snapshot, so assume snapshots of equal duration-- use extra_functionalities for
+    segments of varying duration. """
 
     # The battery constraint is built here - it doesn't need a special function because it doesn't depend on time
     network.model.battery_interface = pm.Constraint(
@@ -402,13 +442,14 @@ def pyomo_constraints(network, snapshots):
                            network.links.efficiency["BatteryInterfaceOut"])
 
     # Constrain the maximum discharge of the H2 storage relative to its size
-    time_step_cycle = 4/8760*timestep*0.5  # Factor 0.5 for 3 hour time step, 0.5 for oversized storage
+    # discharge over one snapshot of snapshot_duration hours, with a factor 0.5 for oversized storage
+    time_step_cycle = 4/8760*snapshot_duration(snapshots)*0.5
     network.model.cycling_limit = pm.Constraint(
         rule=lambda model: network.model.link_p_nom['BatteryInterfaceOut'] ==
                            network.model.store_e_nom['CompressedH2Store'] * time_step_cycle)
 
     # The HB Ramp constraints are functions of time, so we need to create some pyomo sets/parameters to represent them.
-    network.model.t = pm.Set(initialize=network.snapshots)
+    network.model.t = pm.Set(initialize=network.snapshots, ordered=True)
     network.model.HB_max_ramp_down = pm.Param(initialize=network.links.loc['HB'].ramp_limit_down)
     network.model.HB_max_ramp_up = pm.Param(initialize=network.links.loc['HB'].ramp_limit_up)
 
@@ -422,7 +463,7 @@ def pyomo_constraints(network, snapshots):
 def pyomo_operating_constraints(network, snapshots):
     """Exactly as per the other constraints, but excludes any constraints which only apply during design"""
     # The HB Ramp constraints are functions of time, so we need to create some pyomo sets/parameters to represent them.
-    network.model.t = pm.Set(initialize=network.snapshots)
+    network.model.t = pm.Set(initialize=network.snapshots, ordered=True)
     network.model.HB_max_ramp_down = pm.Param(initialize=network.links.loc['HB'].ramp_limit_down)
     network.model.HB_max_ramp_up = pm.Param(initialize=network.links.loc['HB'].ramp_limit_up)
     network.model.HB_capacity = pm.Param(initialize=network.links.loc['HB'].p_nom_opt)
@@ -467,7 +508,12 @@ def convert_network_to_operating(n, ammonia_cost_per_ton=500, aggregation_count=
         pd.read_csv('HB_p_max_pu.csv').set_index('snapshot').rename(columns={'HB_Max': 'HB'}), aggregation_count)
 
     # Re-solves model:
-    n.lopf(solver_name='gurobi', pyomo=True, extra_functionality=pyomo_operating_constraints)
+    with solvers.highs_reader():
+        n.lopf(solver_name=solvers.solver_name,
+               solver_options=solvers.solver_options(),
+               solver_logfile=solvers.solver_logfile(),
+               pyomo=False,
+               extra_functionality=extra_operating_functionalities)
 
     if not multi_site:
         detailed_results = get_results_dict_for_excel(n, 1, aggregation_count, operating=True, time_step=time_step)
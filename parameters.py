@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Loads the Excel parameter workbooks.
+
+Each sheet is parsed at most once per process. Parsed sheets are also saved
+to a binary cache keyed on the contents of the workbook, so later runs can
+skip parsing the Excel files until a workbook is edited.
+
+The sheets read on hot paths are validated into typed records so that a
+missing or misspelled parameter is reported when the workbook is loaded.
+"""
+
+import hashlib
+import os
+import pickle
+from dataclasses import dataclass, field, fields
+from functools import lru_cache
+
+import pandas as pd
+
+transport_excel_path = "Parameters/transport_parameters.xlsx"
+pipeline_excel_path = "Parameters/pipeline_parameters.xlsx"
+
+# parsed sheets are cached in this folder-- set to None to always parse the Excel files
+cache_dir = 'Resources/parameter_cache'
+
+
+def read_excel(path, sheet_name=0, index_col=None):
+    '''
+    reads a sheet of an Excel workbook, parsing each sheet only once.
+
+    Parameters
+    ----------
+    path : string
+        path to Excel file.
+    sheet_name : string or int, optional
+        name or position of sheet. Default is the first sheet.
+    index_col : string, optional
+        column to use as index. Default is None.
+
+    Returns
+    -------
+    sheet : pandas DataFrame
+        copy of the sheet, which callers are free to modify.
+    '''
+    return _read_sheet(os.path.abspath(path), sheet_name, index_col).copy()
+
+
+@lru_cache(maxsize=None)
+def _read_sheet(path, sheet_name, index_col):
+    if cache_dir is None:
+        return pd.read_excel(path, sheet_name=sheet_name, index_col=index_col)
+    with open(path, 'rb') as file:
+        key = hashlib.sha256(file.read())
+    key.update(repr((sheet_name, index_col, pd.__version__)).encode())
+    cache_path = os.path.join(cache_dir, key.hexdigest() + '.pkl')
+    if os.path.exists(cache_path):
+        try:
+            return pd.read_pickle(cache_path)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            pass  # corrupt cache file, so parse the workbook again
+    sheet = pd.read_excel(path, sheet_name=sheet_name, index_col=index_col)
+    os.makedirs(cache_dir, exist_ok=True)
+    # write to a temporary file first so parallel runs never read a partial file
+    temporary_path = f'{cache_path}.{os.getpid()}'
+    sheet.to_pickle(temporary_path)
+    os.replace(temporary_path, cache_path)
+    return sheet
+
+
+def _parameter(label):
+    return field(metadata={'label': label})
+
+
+def _to_record(record_type, series, source):
+    '''
+    validates a parameter series into a record with a float for each field.
+    '''
+    labels = {item.name: item.metadata['label'] for item in fields(record_type)}
+    missing = [label for label in labels.values() if label not in series.index]
+    if missing:
+        raise KeyError(f'{source} is missing parameters: {missing}')
+    values = {}
+    for name, label in labels.items():
+        try:
+            values[name] = float(series[label])
+        except (TypeError, ValueError):
+            raise ValueError(f'{source} parameter "{label}" is not a number: {series[label]!r}')
+    return record_type(**values)
+
+
+@dataclass(frozen=True)
+class TruckingParameters:
+    average_truck_speed: float = _parameter('Average truck speed (km/h)')
+    working_hours: float = _parameter('Working hours (h/day)')
+    diesel_price: float = _parameter('Diesel price (euros/L)')
+    costs_for_driver: float = _parameter('Costs for driver (euros/h)')
+    working_days: float = _parameter('Working days (per year)')
+    max_driving_dist: float = _parameter('Max driving distance (km/a)')
+    spec_capex_truck: float = _parameter('Spec capex truck (euros)')
+    spec_opex_truck: float = _parameter('Spec opex truck (% of capex/a)')
+    diesel_consumption: float = _parameter('Diesel consumption (L/100 km)')
+    truck_lifetime: float = _parameter('Truck lifetime (a)')
+    spec_capex_trailor: float = _parameter('Spec capex trailer (euros)')
+    spec_opex_trailor: float = _parameter('Spec opex trailer (% of capex/a)')
+    net_capacity: float = _parameter('Net capacity (kg NH3)')
+    trailor_lifetime: float = _parameter('Trailer lifetime (a)')
+    loading_unloading_time: float = _parameter('Loading unloading time (h)')
+
+
+@dataclass(frozen=True)
+class PipelineParameters:
+    opex: float = _parameter('Opex (% of capex)')
+    availability: float = _parameter('Availability')
+    lifetime_pipeline: float = _parameter('Pipeline lifetime (a)')
+    electricity_demand: float = _parameter('Electricity demand (kWh/kg*km)')
+    large_max_capacity: float = _parameter('Large pipeline max capacity (t NH3/a)')
+    large_min_capacity: float = _parameter('Large pipeline min capacity (t NH3/a)')
+    med_min_capacity: float = _parameter('Medium pipeline min capacity (t NH3/a)')
+    small_min_capacity: float = _parameter('Small pipeline min capcity (t NH3/a)')
+
+
+@dataclass(frozen=True)
+class PipelineSizeParameters:
+    y_int: float = _parameter('Capex y-intercept (€/t/yr/100km)')
+    slope: float = _parameter('Capex flow coefficient (€/t^2/yr^2/100km)')
+
+
+@lru_cache(maxsize=None)
+def trucking_parameters(excel_path=transport_excel_path):
+    '''
+    reads the ammonia trucking parameters from the "NH3" sheet of transport_parameters.xlsx.
+
+    Returns
+    -------
+    parameters : TruckingParameters
+        trucking parameters.
+    '''
+    series = read_excel(excel_path, sheet_name='NH3', index_col='Parameter').squeeze('columns')
+    return _to_record(TruckingParameters, series, f'{excel_path} sheet "NH3"')
+
+
+@lru_cache(maxsize=None)
+def pipeline_parameters(excel_path=pipeline_excel_path):
+    '''
+    reads the parameters for all pipeline sizes from the "All" sheet of pipeline_parameters.xlsx.
+
+    Returns
+    -------
+    parameters : PipelineParameters
+        pipeline parameters.
+    '''
+    series = read_excel(excel_path, sheet_name='All', index_col='Parameter').squeeze('columns')
+    return _to_record(PipelineParameters, series, f'{excel_path} sheet "All"')
+
+
+@lru_cache(maxsize=None)
+def pipeline_size_parameters(pipeline_type, excel_path=pipeline_excel_path):
+    '''
+    reads the capital cost coefficients of one pipeline size from pipeline_parameters.xlsx.
+
+    Parameters
+    ----------
+    pipeline_type : string
+        pipeline size, "Small", "Medium" or "Large".
+
+    Returns
+    -------
+    parameters : PipelineSizeParameters
+        capital cost coefficients.
+    '''
+    series = read_excel(excel_path, sheet_name=pipeline_type, index_col='Parameter').squeeze('columns')
+    return _to_record(PipelineSizeParameters, series, f'{excel_path} sheet "{pipeline_type}"')
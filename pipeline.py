@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Runs the stages of the model in order, re-running only what has changed.
+
+Each stage is a script with a main() function. Before a stage runs, its
+inputs are hashed: parameter workbooks, the plant design, the cutout and the
+columns it reads from the hexagon file of the previous stage. Stages whose
+inputs match the hashes recorded in a manifest when they last completed are
+skipped. As the output of each stage is an input of the next, a change is
+only passed on as far as the outputs it changes.
+
+Stages which calculate columns for each demand center also hash the inputs
+of each demand center separately. If only some demand centers changed, those
+stages update the columns of those demand centers and keep the others. The
+stored plant optimization results of changed demand centers are deleted
+before the plant stage runs, so they are re-solved, while the results of
+other demand centers are reused.
+
+Set force to True to run every stage, e.g. after changing the code of a stage.
+"""
+
+import hashlib
+import importlib
+import json
+import os
+from dataclasses import dataclass
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+import hexagon_io
+import parameters
+
+# stages which have not changed since they last completed are skipped-- set to True to run every stage
+force = False
+manifest_path = 'Resources/pipeline_manifest.json'
+# files larger than this many bytes (e.g. cutouts) are hashed by their size and modification time
+large_file_size = 2**28
+
+demand_excel_path = 'Parameters/demand_parameters.xlsx'
+country_excel_path = 'Parameters/country_parameters.xlsx'
+technology_excel_path = 'Parameters/technology_parameters.xlsx'
+transport_excel_path = 'Parameters/transport_parameters.xlsx'
+pipeline_excel_path = 'Parameters/pipeline_parameters.xlsx'
+weather_excel_path = 'Parameters/weather_parameters.xlsx'
+plant_design_path = 'Parameters/Basic_ammonia_plant'
+
+
+def cutout_path():
+    '''
+    path to the cutout named in the weather parameters.
+    '''
+    weather_parameters = parameters.read_excel(weather_excel_path, index_col='Parameters').squeeze('columns')
+    return os.path.join('Cutouts', weather_parameters['Filename'] + '.nc')
+
+
+@dataclass(frozen=True)
+class Stage:
+    '''
+    a script of the model and the inputs it reads.
+
+    Files may be given as paths or as functions returning a path. Columns
+    read for each demand center are formatted with the name of the demand
+    center, and columns=None hashes the whole hexagon file.
+    '''
+    name: str
+    module: str
+    files: tuple = ()
+    hexagons: str = None
+    columns: tuple = None
+    demand_center_columns: tuple = ()
+    by_demand_center: bool = False
+    # function of the module called with the demand centers whose inputs changed, before the stage runs
+    invalidate: str = None
+    output: str = None
+
+
+stages = [
+    Stage('assign_country', 'assign_country',
+          files=('Data/hex_final.geojson',),
+          output='Data/hexagons_with_country.geojson'),
+    Stage('optimize_transport', 'optimize_transport',
+          files=('Data/hexagons_with_country.geojson', technology_excel_path, country_excel_path,
+                 transport_excel_path, pipeline_excel_path),
+          by_demand_center=True,
+          output=hexagon_io.stage_path('hex_transport')),
+    Stage('optimize_ammonia_plant', 'optimize_ammonia_plant',
+          files=(country_excel_path, technology_excel_path, transport_excel_path, weather_excel_path,
+                 plant_design_path, cutout_path),
+          hexagons='hex_transport',
+          columns=('country', 'theo_turbines', 'theo_pv', 'geometry'),
+          demand_center_columns=('{} road construction costs',
+                                 '{} trucking transport costs',
+                                 '{} pipeline transport costs'),
+          by_demand_center=True,
+          invalidate='clear_results',
+          output=hexagon_io.stage_path('hex_lcoa')),
+    Stage('water_cost', 'water_cost',
+          files=(technology_excel_path, country_excel_path),
+          hexagons='hex_lcoa',
+          output=hexagon_io.stage_path('hex_water')),
+    Stage('total_ammonia_cost', 'total_ammonia_cost',
+          files=(demand_excel_path,),
+          hexagons='hex_water',
+          output=hexagon_io.stage_path('hex_total_cost')),
+    Stage('costs_by_component', 'costs_by_component',
+          files=(demand_excel_path, country_excel_path, plant_design_path),
+          hexagons='hex_total_cost',
+          output=hexagon_io.stage_path('hex_cost_components')),
+    # map_costs skips figures which have not changed itself
+    Stage('map_costs', 'map_costs',
+          files=(demand_excel_path,),
+          hexagons='hex_total_cost'),
+]
+
+
+def _update_file(key, path):
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            _update_file(key, os.path.join(path, name))
+        return
+    key.update(path.encode())
+    if not os.path.exists(path):
+        key.update(b'missing')
+        return
+    status = os.stat(path)
+    if status.st_size > large_file_size:
+        key.update(repr((status.st_size, status.st_mtime_ns)).encode())
+        return
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(2**20), b''):
+            key.update(block)
+
+
+def _update_columns(key, stage, columns):
+    table = pq.read_table(hexagon_io.stage_path(stage), columns=list(columns), use_pandas_metadata=True)
+    frame = table.to_pandas()
+    key.update(repr(list(frame.columns)).encode())
+    if 'geometry' in frame.columns:
+        # geometry is read as WKB, which is hashed as it is
+        key.update(b''.join(frame.pop('geometry')))
+    key.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+
+
+def input_hash(stage):
+    '''
+    hash of the inputs of a stage which are shared by all demand centers.
+    '''
+    key = hashlib.sha256()
+    for path in stage.files:
+        _update_file(key, path() if callable(path) else path)
+    if stage.hexagons is not None:
+        if stage.columns is None:
+            _update_file(key, hexagon_io.stage_path(stage.hexagons))
+        else:
+            _update_columns(key, stage.hexagons, stage.columns)
+    return key.hexdigest()
+
+
+def demand_center_hash(stage, demand_parameters, demand_center):
+    '''
+    hash of the inputs of a stage for one demand center.
+    '''
+    key = hashlib.sha256()
+    key.update(repr(demand_parameters.loc[demand_center].tolist()).encode())
+    if stage.demand_center_columns:
+        _update_columns(key, stage.hexagons, [column.format(demand_center) for column in stage.demand_center_columns])
+    return key.hexdigest()
+
+
+def _read_manifest():
+    try:
+        with open(manifest_path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(manifest):
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    with open(f'{manifest_path}.{os.getpid()}', 'w') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(f'{manifest_path}.{os.getpid()}', manifest_path)
+
+
+def run(stages=stages, force=False):
+    '''
+    runs the stages whose inputs changed since they last completed.
+
+    Parameters
+    ----------
+    stages : list, optional
+        Stage of each script, in the order they are run. Default is all stages.
+    force : boolean, optional
+        whether to run every stage for every demand center. Default is False.
+    '''
+    manifest = _read_manifest()
+    for stage in stages:
+        record = manifest.get(stage.name, {})
+        inputs = input_hash(stage)
+        complete = (not force
+                    and record.get('inputs') == inputs
+                    and (stage.output is None or os.path.exists(stage.output)))
+        module = importlib.import_module(stage.module)
+
+        if not stage.by_demand_center:
+            if complete:
+                print(f'{stage.name}: inputs unchanged, skipping.')
+                continue
+            print(f'{stage.name}: running.')
+            module.main()
+            manifest[stage.name] = {'inputs': inputs}
+            _write_manifest(manifest)
+            continue
+
+        demand_parameters = parameters.read_excel(demand_excel_path, index_col='Demand center')
+        demand_centers = {demand_center: demand_center_hash(stage, demand_parameters, demand_center)
+                          for demand_center in demand_parameters.index}
+        previous = record.get('demand_centers', {})
+        if complete:
+            changed = [demand_center for demand_center, key in demand_centers.items()
+                       if previous.get(demand_center) != key]
+            if not changed:
+                # columns of removed demand centers are left in place, as later stages only read current ones
+                print(f'{stage.name}: inputs unchanged, skipping.')
+                manifest[stage.name] = dict(record, demand_centers=demand_centers)
+                _write_manifest(manifest)
+                continue
+            print(f'{stage.name}: running for changed demand centers {changed}.')
+        else:
+            changed = list(demand_centers)
+            print(f'{stage.name}: running for all demand centers.')
+
+        if stage.invalidate is not None:
+            # results cleared for the same inputs by an interrupted run are not cleared again, so the run resumes
+            cleared = record.get('cleared', {})
+            stale = [demand_center for demand_center in changed
+                     if cleared.get(demand_center) != [inputs, demand_centers[demand_center]]]
+            getattr(module, stage.invalidate)(stale)
+            cleared.update({demand_center: [inputs, demand_centers[demand_center]] for demand_center in stale})
+            manifest[stage.name] = dict(record, cleared=cleared)
+            _write_manifest(manifest)
+
+        module.main(demand_centers=changed if complete else None)
+        manifest[stage.name] = {'inputs': inputs,
+                                'demand_centers': demand_centers,
+                                'cleared': manifest.get(stage.name, {}).get('cleared', {})}
+        _write_manifest(manifest)
+
+
+def main():
+    run(stages, force=force)
+
+
+if __name__ == '__main__':
+    main()
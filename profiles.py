@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-unit wind and solar profiles of the hexagons.
+
+Converting the weather in an atlite cutout into the per-unit potential of
+each hexagon is the slowest step of reading the weather. Its result is
+saved to a NetCDF cube for each technology configuration (e.g. a wind
+turbine or solar panel), keyed on the cutout, the hexagon shapes and the
+conversion settings, and later runs open the cube instead of converting
+again. Several configurations are converted in a single pass over the
+cutout, which is read one time slice at a time.
+
+Cubes are stored at the resolution of the cutout with the series of each
+hexagon in its own chunk, so reading the profile of a hexagon is one
+contiguous read. They are opened lazily, so only the hexagons which are
+read are loaded into memory.
+"""
+
+import hashlib
+import os
+
+import atlite
+import numpy as np
+import pandas as pd
+import xarray as xr
+from atlite.resource import get_windturbineconfig
+
+# profile cubes are cached in this folder-- set to None to always convert the cutout
+cache_dir = 'Resources/profile_cache'
+# the cutout is read in time slices of this pandas frequency, and each slice is converted for every configuration
+slice_freq = 'M'
+# number of hexagons read at once when averaging over all hexagons
+block_size = 1000
+
+
+def _cache_key(cutout_path, hexagons, technology, settings):
+    key = hashlib.sha256()
+    # a cutout can be many gigabytes, so it enters the key through its size and modification time
+    status = os.stat(cutout_path)
+    key.update(repr((os.path.basename(cutout_path), status.st_size, status.st_mtime_ns)).encode())
+    key.update(repr(list(hexagons.index)).encode())
+    key.update(b''.join(hexagons.geometry.to_wkb()))
+    key.update(repr((technology, sorted(settings.items()))).encode())
+    return key.hexdigest()
+
+
+def turbine_capacity(turbine):
+    '''
+    rated capacity of a wind turbine in MW, from its atlite definition.
+    '''
+    return get_windturbineconfig(turbine)['P']
+
+
+def _convert(cutout_path, hexagons, configurations):
+    cutout = atlite.Cutout(cutout_path)
+    layout = cutout.uniform_layout()
+    # the overlap of hexagons and grid cells is the same for every configuration and time slice
+    matrix = cutout.indicatormatrix(hexagons)
+    slices = {name: [] for name in configurations}
+    for period in cutout.data.indexes['time'].to_period(slice_freq).unique():
+        # each slice of weather is read from disk once, then converted for every configuration
+        weather = cutout.sel(time=slice(str(period), str(period)))
+        weather.data.load()
+        for name, (technology, settings) in configurations.items():
+            slices[name].append(getattr(weather, technology)(matrix=matrix,
+                                                             index=hexagons.index,
+                                                             layout=layout,
+                                                             per_unit=True,
+                                                             show_progress=False,
+                                                             **settings))
+    cubes = {}
+    for name, (technology, settings) in configurations.items():
+        profile = xr.concat(slices[name], dim='time')
+        hexagon_dim = next(dim for dim in profile.dims if dim != 'time')
+        # hexagon-major, so that the series of each hexagon is contiguous on disk
+        profile = profile.transpose(hexagon_dim, 'time')
+        cubes[name] = xr.DataArray(profile.to_numpy(),
+                                   coords={'hexagon': profile[hexagon_dim].to_numpy(),
+                                           'time': profile['time'].to_numpy()},
+                                   dims=('hexagon', 'time'),
+                                   name=technology)
+    return cubes
+
+
+def profile_cubes(cutout_path, hexagons, configurations):
+    '''
+    calculates the per-unit potential in each hexagon for several technology
+    configurations in one pass over the cutout, or opens them from the cache
+    if they were calculated before. Each configuration is cached separately.
+
+    Parameters
+    ----------
+    cutout_path : string
+        path to atlite cutout.
+    hexagons : geopandas GeoDataFrame
+        hexagons.
+    configurations : dict
+        atlite conversion function ("wind" or "pv") and dictionary of its
+        keyword arguments for each configuration, e.g.
+        {'wind': ('wind', dict(turbine='NREL_ReferenceTurbine_2020ATB_4MW'))}.
+
+    Returns
+    -------
+    profiles : dict
+        per-unit potential of each configuration at the resolution of the
+        cutout, as xarray DataArrays with hexagon and time dimensions. Values
+        are read from disk when used.
+    '''
+    cubes = {}
+    cache_paths = {}
+    for name, (technology, settings) in configurations.items():
+        if cache_dir is None:
+            continue
+        cache_paths[name] = os.path.join(cache_dir,
+                                         f'{technology}_{_cache_key(cutout_path, hexagons, technology, settings)}.nc')
+        if os.path.exists(cache_paths[name]):
+            try:
+                cubes[name] = xr.open_dataarray(cache_paths[name])
+            except (OSError, ValueError):
+                pass  # corrupt cache file, so convert again
+    missing = {name: configuration for name, configuration in configurations.items() if name not in cubes}
+    if not missing:
+        return cubes
+    converted = _convert(cutout_path, hexagons, missing)
+    if cache_dir is None:
+        return {**cubes, **converted}
+    os.makedirs(cache_dir, exist_ok=True)
+    for name, profile in converted.items():
+        # write to a temporary file first so parallel runs never read a partial file
+        temporary_path = f'{cache_paths[name]}.{os.getpid()}'
+        profile.to_netcdf(temporary_path, engine='netcdf4',
+                          encoding={profile.name: {'chunksizes': (1, profile.sizes['time'])}})
+        os.replace(temporary_path, cache_paths[name])
+        cubes[name] = xr.open_dataarray(cache_paths[name])
+    return cubes
+
+
+def hexagon_profile(profile, hexagon, times):
+    '''
+    reads the profile of one hexagon at the snapshots of the optimization.
+
+    Parameters
+    ----------
+    profile : xarray DataArray
+        profile cube from profile_cubes().
+    hexagon : int
+        hexagon index.
+    times : pandas DatetimeIndex
+        snapshots with a frequency, e.g. the index of a demand schedule.
+
+    Returns
+    -------
+    profile : xarray DataArray
+        mean per-unit potential over each snapshot.
+    '''
+    return profile.sel(hexagon=hexagon).load().resample(time=times.freqstr).mean().sel(time=times)
+
+
+def mean_profile(profile, times):
+    '''
+    calculates the mean per-unit potential of each hexagon over the snapshots
+    of the optimization, reading a block of hexagons at a time.
+
+    Parameters
+    ----------
+    profile : xarray DataArray
+        profile cube from profile_cubes().
+    times : pandas DatetimeIndex
+        snapshots with a frequency, e.g. the index of a demand schedule.
+
+    Returns
+    -------
+    mean : pandas Series
+        mean per-unit potential, indexed by hexagon.
+    '''
+    # the snapshots cover the time from the first up to the end of the last
+    period = slice(times[0], times[-1] + times.freq - pd.Timedelta(1, 'ns'))
+    means = [profile.isel(hexagon=slice(start, start + block_size)).sel(time=period).mean('time').to_numpy()
+             for start in range(0, profile.sizes['hexagon'], block_size)]
+    return pd.Series(np.concatenate(means), index=profile['hexagon'].to_numpy())
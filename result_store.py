@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+On-disk journal of ammonia plant optimization results.
+
+Results are written for each hexagon as soon as it is solved, keyed by
+demand center, transport mode and hexagon, so that an interrupted run of
+optimize_ammonia_plant.py can be restarted without re-solving hexagons.
+
+The inputs each demand center was solved with are recorded with its results,
+so that results of a demand center whose inputs changed can be found and
+deleted instead of being reused.
+"""
+
+import sqlite3
+import pandas as pd
+
+KEY_COLUMNS = ['demand_center', 'transport', 'hexagon']
+
+
+def _quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+
+def open_result_store(path, result_columns):
+    '''
+    opens the result store, creating it or adding missing result columns if needed.
+
+    Parameters
+    ----------
+    path : string
+        path to SQLite file.
+    result_columns : list
+        names of the results saved for each hexagon.
+
+    Returns
+    -------
+    store : sqlite3 Connection
+        connection to the result store.
+    '''
+    store = sqlite3.connect(path)
+    # write-ahead logging keeps the journal consistent if the run is killed mid-write
+    store.execute('PRAGMA journal_mode=WAL')
+    store.execute('PRAGMA synchronous=NORMAL')
+    store.execute('CREATE TABLE IF NOT EXISTS results ('
+                  'demand_center TEXT NOT NULL, '
+                  'transport TEXT NOT NULL, '
+                  'hexagon INTEGER NOT NULL, '
+                  'PRIMARY KEY (demand_center, transport, hexagon))')
+    store.execute('CREATE TABLE IF NOT EXISTS provenance ('
+                  'demand_center TEXT PRIMARY KEY, '
+                  'inputs TEXT NOT NULL)')
+    existing_columns = [row[1] for row in store.execute('PRAGMA table_info(results)')]
+    for column in result_columns:
+        if column not in existing_columns:
+            store.execute(f'ALTER TABLE results ADD COLUMN {_quote(column)} REAL')
+    store.commit()
+    return store
+
+
+def record_result(store, demand_center, transport, hexagon, result, result_columns):
+    '''
+    saves the optimization results for one hexagon to the result store.
+
+    Parameters
+    ----------
+    store : sqlite3 Connection
+        connection to the result store.
+    demand_center : string
+        name of demand center.
+    transport : string
+        transport mode, "trucking" or "pipeline".
+    hexagon : int
+        hexagon index.
+    result : tuple
+        results in the same order as result_columns.
+    result_columns : list
+        names of the results.
+    '''
+    columns = ', '.join(_quote(column) for column in KEY_COLUMNS + list(result_columns))
+    placeholders = ', '.join('?' * (len(KEY_COLUMNS) + len(result_columns)))
+    store.execute(f'INSERT OR REPLACE INTO results ({columns}) VALUES ({placeholders})',
+                  [demand_center, transport, int(hexagon)] + [float(value) for value in result])
+    store.commit()
+
+
+def solved_hexagons(store, demand_center, transport):
+    '''
+    finds the hexagons already solved for a demand center and transport mode.
+
+    Returns
+    -------
+    hexagons : set
+        indices of solved hexagons.
+    '''
+    rows = store.execute('SELECT hexagon FROM results WHERE demand_center = ? AND transport = ?',
+                         (demand_center, transport))
+    return {row[0] for row in rows}
+
+
+def load_results(store, demand_center, transport, result_columns):
+    '''
+    reads the optimization results for a demand center and transport mode.
+
+    Returns
+    -------
+    results : pandas DataFrame
+        results indexed by hexagon.
+    '''
+    columns = ', '.join(_quote(column) for column in ['hexagon'] + list(result_columns))
+    return pd.read_sql_query(f'SELECT {columns} FROM results WHERE demand_center = ? AND transport = ?',
+                             store,
+                             params=(demand_center, transport),
+                             index_col='hexagon',
+                             ).astype(float).sort_index()
+
+
+def clear_results(store, demand_center):
+    '''
+    deletes the optimization results and their inputs for a demand center, e.g. after its inputs change.
+    '''
+    store.execute('DELETE FROM results WHERE demand_center = ?', (demand_center,))
+    store.execute('DELETE FROM provenance WHERE demand_center = ?', (demand_center,))
+    store.commit()
+
+
+def load_provenance(store):
+    '''
+    reads the inputs each demand center in the result store was solved with.
+
+    Returns
+    -------
+    provenance : dict
+        inputs as a string, e.g. JSON, keyed by demand center.
+    '''
+    return dict(store.execute('SELECT demand_center, inputs FROM provenance'))
+
+
+def record_provenance(store, demand_center, inputs):
+    '''
+    saves the inputs a demand center is solved with, before its results are recorded.
+    '''
+    store.execute('INSERT OR REPLACE INTO provenance (demand_center, inputs) VALUES (?, ?)',
+                  (demand_center, inputs))
+    store.commit()
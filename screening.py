@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lower bound on the levelized cost of ammonia in each hexagon.
+
+The bound ignores the timing of generation and demand: the electricity the
+plant needs over a year is supplied by the generator with the lowest
+annualized cost per MWh at the hexagon's capacity factor, up to its land
+limit, then by the other generator. The electrolyzer and Haber-Bosch plant
+must at least be sized for their average load. Every other cost of the
+plant model is non-negative, so the optimized cost is never below the bound.
+
+Hexagons whose land cannot supply enough electricity have an infinite bound.
+"""
+
+import numpy as np
+import pandas as pd
+
+from functions import CRF
+
+
+def electricity_per_ammonia(n):
+    '''
+    calculates the electricity used per MWh of ammonia produced by the plant,
+    without storage or compression losses.
+
+    Parameters
+    ----------
+    n : pypsa Network
+        plant network.
+
+    Returns
+    -------
+    electricity : float
+        MWh of electricity per MWh of ammonia.
+    hydrogen : float
+        MWh of hydrogen per MWh of ammonia.
+    '''
+    haber_bosch = n.links.loc['HB']
+    hydrogen = -haber_bosch['efficiency2'] / haber_bosch['efficiency']
+    electricity = 1 / haber_bosch['efficiency'] + hydrogen / n.links.loc['Electrolysis', 'efficiency']
+    return electricity, hydrogen
+
+
+def country_crf(countries, country_parameters, technology):
+    '''
+    calculates the capital recovery factor of a technology for each hexagon.
+
+    Parameters
+    ----------
+    countries : pandas Series
+        country of each hexagon.
+    country_parameters : pandas DataFrame
+        interest rates and lifetimes, indexed by country.
+    technology : string
+        "Wind", "Solar" or "Plant".
+
+    Returns
+    -------
+    crf : numpy array
+        capital recovery factor of each hexagon.
+    '''
+    # the capital recovery factor is calculated once per country, then looked up for each hexagon
+    crf = pd.Series(CRF(country_parameters[f'{technology} interest rate'],
+                        country_parameters[f'{technology} lifetime (years)']),
+                    index=country_parameters.index)
+    return countries.map(crf).to_numpy(dtype=float)
+
+
+def production_cost_bound(n, overnight_capital_costs, ammonia_demand,
+                          wind_cf, pv_cf, wind_max_capacity, pv_max_capacity,
+                          wind_crf, pv_crf, plant_crf):
+    '''
+    calculates a lower bound on the levelized cost of ammonia in each hexagon.
+
+    Parameters
+    ----------
+    n : pypsa Network
+        plant network.
+    overnight_capital_costs : dict
+        capital costs of generators and links before annualization.
+    ammonia_demand : float
+        annual ammonia demand in MWh.
+    wind_cf, pv_cf : array-like
+        mean per-unit wind and solar potential of each hexagon.
+    wind_max_capacity, pv_max_capacity : array-like
+        maximum wind and solar capacity of each hexagon in MW.
+    wind_crf, pv_crf, plant_crf : array-like
+        capital recovery factors of wind, solar and the rest of the plant.
+
+    Returns
+    -------
+    lcoa : numpy array
+        lower bound on the levelized cost per kg ammonia, or infinity where
+        the land limits cannot supply the electricity needed.
+    '''
+    electricity, hydrogen = electricity_per_ammonia(n)
+    electricity_demand = ammonia_demand * electricity
+
+    # annualized cost per MWh generated, and maximum annual generation
+    wind_cost = overnight_capital_costs['generators']['Wind'] * np.asarray(wind_crf, dtype=float)
+    pv_cost = overnight_capital_costs['generators']['Solar'] * np.asarray(pv_crf, dtype=float)
+    wind_generation = np.asarray(wind_max_capacity, dtype=float) * np.asarray(wind_cf, dtype=float) * 8760
+    pv_generation = np.asarray(pv_max_capacity, dtype=float) * np.asarray(pv_cf, dtype=float) * 8760
+    with np.errstate(divide='ignore', invalid='ignore'):
+        wind_unit_cost = np.where(wind_generation > 0, wind_cost / (np.asarray(wind_cf) * 8760), np.inf)
+        pv_unit_cost = np.where(pv_generation > 0, pv_cost / (np.asarray(pv_cf) * 8760), np.inf)
+
+    # the cheaper generator is used up to its land limit first
+    wind_first = wind_unit_cost <= pv_unit_cost
+    first_cost = np.where(wind_first, wind_unit_cost, pv_unit_cost)
+    second_cost = np.where(wind_first, pv_unit_cost, wind_unit_cost)
+    first_generation = np.minimum(np.where(wind_first, wind_generation, pv_generation), electricity_demand)
+    second_generation = electricity_demand - first_generation
+    feasible = second_generation <= np.where(wind_first, pv_generation, wind_generation) * (1 + 1e-9)
+    generation_cost = first_generation * first_cost \
+        + np.where(second_generation > 0, second_generation * second_cost, 0.)
+
+    # electrolysis and Haber-Bosch capacities are at least their average load
+    plant_capacity_cost = (overnight_capital_costs['links']['Electrolysis']
+                           * ammonia_demand * hydrogen / n.links.loc['Electrolysis', 'efficiency']
+                           + overnight_capital_costs['links']['HB']
+                           * ammonia_demand / n.links.loc['HB', 'efficiency']) / 8760
+    plant_cost = plant_capacity_cost * np.asarray(plant_crf, dtype=float)
+
+    ammonia_kg = ammonia_demand / 6.25 * 1000
+    return np.where(feasible, (generation_cost + plant_cost) / ammonia_kg, np.inf)
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Solver selection for the ammonia plant optimization.
+
+Each supported solver has a profile of settings -- solution method,
+presolve, crossover and convergence tolerance -- which is translated into
+the options format PyPSA passes to that solver. HiGHS is the default, so
+that the model can run without a commercial solver license.
+
+A benchmark mode times each available solver on a sample of problems and
+picks the fastest.
+
+PyPSA 0.21 reads the HiGHS solution file as fixed-width columns whose widths
+are guessed from its first rows, which fails for the solution files of
+current HiGHS versions once the model has more than a few thousand
+variables. highs_reader() replaces that reader within a with block, e.g.
+around n.lopf(), with one which splits the columns on whitespace.
+"""
+
+import contextlib
+import importlib.util
+import io
+import math
+import os
+import re
+import shutil
+import subprocess
+import time
+
+import pandas as pd
+import pypsa.linopf
+from pypsa.linopt import set_int_index
+
+# solver used by default-- "highs", "cbc", "glpk" or "gurobi"
+solver_name = 'highs'
+
+# settings for each solver-- method is "barrier" or "simplex", and tolerance is the barrier convergence tolerance
+solver_profiles = {
+    'highs': dict(method='barrier', presolve=True, crossover=True, tolerance=1e-6),
+    'cbc': dict(method='simplex', presolve=True, crossover=False, tolerance=None),
+    'glpk': dict(method='simplex', presolve=True, crossover=False, tolerance=None),
+    'gurobi': dict(method='barrier', presolve=True, crossover=True, tolerance=1e-8),
+}
+
+# solvers which PyPSA can warm start from the basis of an earlier solve-- it ignores warm starts for HiGHS
+basis_solvers = ['cbc', 'glpk', 'gurobi']
+
+# folder the log of the last solve of each process is saved to-- set to None to discard solver logs
+log_dir = 'Resources/solver_logs'
+
+# executables of command-line solvers and Python packages of the others
+_executables = {'highs': 'highs', 'cbc': 'cbc', 'glpk': 'glpsol'}
+_packages = {'gurobi': 'gurobipy'}
+
+
+def available_solvers():
+    '''
+    lists the supported solvers which are installed.
+
+    Returns
+    -------
+    solvers : list
+        names of installed solvers.
+    '''
+    return [solver for solver in solver_profiles
+            if (solver in _executables and shutil.which(_executables[solver]) is not None)
+            or (solver in _packages and importlib.util.find_spec(_packages[solver]) is not None)]
+
+
+def solver_logfile():
+    '''
+    path of the solver log of this process, or None if logs are discarded.
+
+    Returns
+    -------
+    path : string
+        path to save the solver log to, which is passed to n.lopf().
+    '''
+    if log_dir is None:
+        return None
+    os.makedirs(log_dir, exist_ok=True)
+    return os.path.join(log_dir, f'solver_{os.getpid()}.log')
+
+
+def solver_options(solver=None, threads=None, warm_start=False):
+    '''
+    translates the profile of a solver into the options PyPSA passes to it.
+
+    Parameters
+    ----------
+    solver : string, optional
+        name of solver. Default is None, which uses solver_name.
+    threads : int, optional
+        maximum number of threads used by the solver. Default is None, which
+        lets the solver decide. GLPK is single-threaded and ignores this.
+    warm_start : boolean, optional
+        whether the solve starts from the basis of an earlier solve. A basis is
+        only used by simplex, so this overrides a barrier method. Default is False.
+
+    Returns
+    -------
+    options : dict or string
+        solver options, as a dictionary for HiGHS and Gurobi or as command-line
+        arguments for CBC and GLPK.
+    '''
+    if solver is None:
+        solver = solver_name
+    if solver not in solver_profiles:
+        raise ValueError(f'Solver "{solver}" is not supported. Choose from {list(solver_profiles)}.')
+    profile = solver_profiles[solver]
+    barrier = profile['method'] == 'barrier' and not warm_start
+
+    if solver == 'highs':
+        options = {'method': 'ipm' if barrier else 'simplex',
+                   'presolve': 'on' if profile['presolve'] else 'off',
+                   'run_crossover': 'on' if profile['crossover'] else 'off'}
+        if profile['tolerance'] is not None:
+            options['ipm_optimality_tolerance'] = profile['tolerance']
+        if threads is not None:
+            options['threads'] = threads
+            options['parallel'] = 'on' if threads > 1 else 'off'
+        return options
+
+    if solver == 'gurobi':
+        options = {'LogToConsole': 0, 'OutputFlag': 0,
+                   'Method': 2 if barrier else 1,
+                   'Presolve': -1 if profile['presolve'] else 0,
+                   'Crossover': -1 if profile['crossover'] else 0}
+        if profile['tolerance'] is not None:
+            options['BarConvTol'] = profile['tolerance']
+        if threads is not None:
+            options['Threads'] = threads
+        return options
+
+    # PyPSA inserts command-line options of CBC before "-solve" and of GLPK at the end of the command
+    if solver == 'cbc':
+        options = f'-presolve {"on" if profile["presolve"] else "off"} '
+        if barrier:
+            options += f'-crossover {"on" if profile["crossover"] else "off"} -barrier '
+        if threads is not None:
+            options += f'-threads {threads} '
+        return options
+
+    options = ' --interior' if barrier else ''
+    if not profile['presolve']:
+        options += ' --nopresol'
+    return options
+
+
+def _read_highs_section(text):
+    # columns of a section are separated by spaces, and names contain none
+    return pd.read_csv(io.StringIO(text), sep=r'\s+')
+
+
+def run_and_read_highs(n, problem_fn, solution_fn, solver_logfile, solver_options={}, warmstart=None,
+                       store_basis=True):
+    '''
+    solves a problem file with the HiGHS executable and reads its solution.
+
+    Takes the place of pypsa.linopt.run_and_read_highs() within
+    highs_reader(), with the same arguments and returns. The status and objective are read from the end of
+    the solution file, so the console log is only saved to the solver logfile.
+
+    Parameters
+    ----------
+    n : pypsa Network
+        network being optimized.
+    problem_fn, solution_fn : string
+        paths of the problem file and of the solution file HiGHS writes.
+    solver_logfile : string
+        path to save the console log to, or None to discard it.
+    solver_options : dict, optional
+        HiGHS options, e.g. from solver_options(). Default is {}.
+    warmstart, store_basis : optional
+        ignored, as PyPSA cannot warm start HiGHS.
+
+    Returns
+    -------
+    status : string
+        "ok" if the solve was optimal, else "warning".
+    termination_condition : string
+        model status reported by HiGHS, e.g. "optimal" or "infeasible".
+    variables_sol : pandas Series
+        value of each variable, indexed by number. None if not optimal.
+    constraints_dual : pandas Series
+        dual value of each constraint, indexed by number. None if not optimal.
+    objective : float
+        objective value. None if not optimal.
+    '''
+    # defaults of PyPSA
+    options = {'method': 'ipm',
+               'primal_feasibility_tolerance': 1e-04,
+               'dual_feasibility_tolerance': 1e-05,
+               'ipm_optimality_tolerance': 1e-6,
+               'presolve': 'on',
+               'run_crossover': True,
+               'parallel': 'off',
+               'threads': 4}
+    options.update(solver_options)
+    options.update(solution_file=solution_fn, write_solution_to_file=True, write_solution_style=1)
+    method = options.pop('method')
+    # next to the problem file rather than in the working directory, as worker processes share that
+    options_fn = f'{solution_fn}.options'
+    with open(options_fn, 'w') as file:
+        file.write('\n'.join(f'{key} = {value}' for key, value in options.items()))
+    try:
+        with open(solver_logfile, 'w') if solver_logfile is not None else open(os.devnull, 'w') as log:
+            subprocess.run(['highs', '--model_file', problem_fn, '--solver', method, '--options_file', options_fn],
+                           stdout=log, stderr=subprocess.STDOUT)
+    finally:
+        os.remove(options_fn)
+    termination_condition, variables_sol, constraints_dual, objective = read_highs_solution(solution_fn)
+    status = 'ok' if 'optimal' in termination_condition else 'warning'
+    return status, termination_condition, variables_sol, constraints_dual, objective
+
+
+def read_highs_solution(solution_fn):
+    '''
+    reads a solution file written by HiGHS in its "pretty" style.
+
+    Parameters
+    ----------
+    solution_fn : string
+        path of the solution file.
+
+    Returns
+    -------
+    termination_condition : string
+        model status reported by HiGHS, e.g. "optimal" or "infeasible".
+    variables_sol : pandas Series
+        value of each variable, indexed by number. None if not optimal.
+    constraints_dual : pandas Series
+        dual value of each constraint, indexed by number. None if not optimal.
+    objective : float
+        objective value. None if not optimal.
+    '''
+    with open(solution_fn) as file:
+        # PyPSA also removes the markers HiGHS puts on infeasible values
+        text = re.sub(r'\*\*\s+', '', file.read())
+    info = dict(re.findall(r'^(Model status|Objective value)\s*:\s*(.*?)\s*$', text, flags=re.M))
+    termination_condition = info.get('Model status', 'unknown').lower()
+    if 'optimal' not in termination_condition:
+        return termination_condition, None, None, None
+
+    _, columns, rows = re.split(r'^(?:Columns|Rows)\s*$', text.split('\nModel status')[0], flags=re.M)
+    columns = _read_highs_section(columns).set_index('Name')
+    rows = _read_highs_section(rows).set_index('Name')
+    variables_sol = set_int_index(pd.to_numeric(columns['Primal'], errors='raise'))
+    constraints_dual = set_int_index(pd.to_numeric(rows['Dual'], errors='raise'))
+    return termination_condition, variables_sol, constraints_dual, float(info['Objective value'])
+
+
+@contextlib.contextmanager
+def highs_reader():
+    '''
+    solves with run_and_read_highs() in place of the HiGHS interface of PyPSA
+    within a with block, e.g. around n.lopf().
+    '''
+    # n.lopf() looks up the function of each solver in pypsa.linopf when it solves
+    original = pypsa.linopf.run_and_read_highs
+    pypsa.linopf.run_and_read_highs = run_and_read_highs
+    try:
+        yield
+    finally:
+        pypsa.linopf.run_and_read_highs = original
+
+
+def benchmark_solvers(solve, problems, solvers=None):
+    '''
+    times each solver on a sample of problems.
+
+    Parameters
+    ----------
+    solve : function
+        function called as solve(problem, solver) for each problem, which
+        returns the objective, e.g. the LCOA. Failed solves return NaN.
+    problems : list
+        sample of problems, e.g. keyword arguments for a few hexagons.
+    solvers : list, optional
+        solvers to compare. Default is None, which compares all available solvers.
+
+    Returns
+    -------
+    fastest : string
+        name of the fastest solver which solved every problem.
+    timings : dict
+        total solve time in seconds of each solver, or None if it failed.
+    '''
+    if solvers is None:
+        solvers = available_solvers()
+    timings = {}
+    for solver in solvers:
+        start = time.perf_counter()
+        try:
+            objectives = [solve(problem, solver) for problem in problems]
+        except Exception as error:
+            print(f'{solver} failed during benchmark: {error}')
+            timings[solver] = None
+            continue
+        # a failed solve returns quickly, so must not count as fast
+        if not all(math.isfinite(objective) for objective in objectives):
+            print(f'{solver} failed to solve every benchmark problem.')
+            timings[solver] = None
+            continue
+        timings[solver] = time.perf_counter() - start
+    solved = {solver: timing for solver, timing in timings.items() if timing is not None}
+    if not solved:
+        raise RuntimeError(f'None of the solvers {solvers} could solve the benchmark problems.')
+    return min(solved, key=solved.get), timings
+
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Distances between hexagons and demand centers.
+
+The geodesic distance from every hexagon centroid to every demand center is
+computed at once with a vectorized solution of the inverse geodesic problem
+on the WGS84 ellipsoid, and saved to a cache keyed on the hexagon centroids
+and demand center coordinates so that later runs can skip the calculation.
+
+The hexagon containing each demand center is found with one spatial index
+query for all demand centers.
+"""
+
+import hashlib
+import os
+import pickle
+
+import geopandas as gpd
+import geopy.distance
+import numpy as np
+import pandas as pd
+
+# distance matrices are cached in this folder-- set to None to always recalculate distances
+cache_dir = 'Resources/distance_cache'
+
+# WGS84 ellipsoid, as used by geopy
+_a = 6378137.0
+_f = 1/298.257223563
+_b = (1 - _f)*_a
+
+
+def geodesic_distance(lat1, lon1, lat2, lon2, tolerance=1e-12, max_iterations=200):
+    '''
+    calculates geodesic distances on the WGS84 ellipsoid using Vincenty's
+    inverse formula. Inputs are broadcast against each other, so passing
+    column and row vectors gives a distance matrix.
+
+    Parameters
+    ----------
+    lat1, lon1 : array-like
+        latitude and longitude of first points in degrees.
+    lat2, lon2 : array-like
+        latitude and longitude of second points in degrees.
+
+    Returns
+    -------
+    distance : numpy array
+        distance in km.
+    '''
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (lat1, lon1, lat2, lon2)))
+    U1 = np.arctan((1 - _f)*np.tan(np.radians(lat1)))
+    U2 = np.arctan((1 - _f)*np.tan(np.radians(lat2)))
+    sinU1, cosU1 = np.sin(U1), np.cos(U1)
+    sinU2, cosU2 = np.sin(U2), np.cos(U2)
+    L = np.radians(lon2 - lon1)
+    lam = L
+    converged = np.zeros(L.shape, dtype=bool)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for _ in range(max_iterations):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.hypot(cosU2*sin_lam, cosU1*sinU2 - sinU1*cosU2*cos_lam)
+            cos_sigma = sinU1*sinU2 + cosU1*cosU2*cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            sin_alpha = np.where(sin_sigma == 0, 0., cosU1*cosU2*sin_lam/sin_sigma)
+            cos2_alpha = 1 - sin_alpha**2
+            # points on the equator have cos2_alpha = 0
+            cos_2sigma_m = np.where(cos2_alpha == 0, 0., cos_sigma - 2*sinU1*sinU2/cos2_alpha)
+            C = _f/16*cos2_alpha*(4 + _f*(4 - 3*cos2_alpha))
+            lam_previous = lam
+            lam = L + (1 - C)*_f*sin_alpha*(sigma + C*sin_sigma*(cos_2sigma_m + C*cos_sigma*(-1 + 2*cos_2sigma_m**2)))
+            converged = np.abs(lam - lam_previous) <= tolerance
+            if converged.all():
+                break
+        u2 = cos2_alpha*(_a**2 - _b**2)/_b**2
+        A = 1 + u2/16384*(4096 + u2*(-768 + u2*(320 - 175*u2)))
+        B = u2/1024*(256 + u2*(-128 + u2*(74 - 47*u2)))
+        delta_sigma = B*sin_sigma*(cos_2sigma_m + B/4*(cos_sigma*(-1 + 2*cos_2sigma_m**2)
+                                                        - B/6*cos_2sigma_m*(-3 + 4*sin_sigma**2)*(-3 + 4*cos_2sigma_m**2)))
+        distance = _b*A*(sigma - delta_sigma)/1000
+    # Vincenty's formula does not converge for nearly antipodal points, so fall back to geopy for these
+    for i in zip(*np.nonzero(~converged)):
+        distance[i] = geopy.distance.geodesic((lat1[i], lon1[i]), (lat2[i], lon2[i])).km
+    return distance
+
+
+def _cache_key(centroids, demand_centers):
+    key = hashlib.sha256()
+    key.update(np.ascontiguousarray(centroids.x.to_numpy(dtype=float)).tobytes())
+    key.update(np.ascontiguousarray(centroids.y.to_numpy(dtype=float)).tobytes())
+    key.update(repr(list(centroids.index)).encode())
+    key.update(repr([(str(d), float(lat), float(lon)) for d, lat, lon
+                     in zip(demand_centers.index, demand_centers['Lat [deg]'], demand_centers['Lon [deg]'])]).encode())
+    return key.hexdigest()
+
+
+def demand_distances(hexagons, demand_centers):
+    '''
+    calculates the distance from each hexagon centroid to each demand center.
+
+    Parameters
+    ----------
+    hexagons : geopandas GeoDataFrame
+        hexagons in a geographic coordinate reference system.
+    demand_centers : pandas DataFrame
+        demand centers with "Lat [deg]" and "Lon [deg]" columns.
+
+    Returns
+    -------
+    distances : pandas DataFrame
+        distance in km, indexed by hexagon with a column for each demand center.
+    '''
+    centroids = hexagons.geometry.centroid
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, _cache_key(centroids, demand_centers) + '.pkl')
+        if os.path.exists(cache_path):
+            try:
+                return pd.read_pickle(cache_path)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                pass  # corrupt cache file, so recalculate distances
+    distances = pd.DataFrame(geodesic_distance(demand_centers['Lat [deg]'].to_numpy()[np.newaxis, :],
+                                               demand_centers['Lon [deg]'].to_numpy()[np.newaxis, :],
+                                               centroids.y.to_numpy()[:, np.newaxis],
+                                               centroids.x.to_numpy()[:, np.newaxis]),
+                             index=hexagons.index,
+                             columns=demand_centers.index)
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # write to a temporary file first so parallel runs never read a partial file
+        temporary_path = f'{cache_path}.{os.getpid()}'
+        distances.to_pickle(temporary_path)
+        os.replace(temporary_path, cache_path)
+    return distances
+
+
+def demand_hexagons(hexagons, demand_centers):
+    '''
+    finds the hexagon containing each demand center with a spatial index query.
+
+    Parameters
+    ----------
+    hexagons : geopandas GeoDataFrame
+        hexagons in a geographic coordinate reference system.
+    demand_centers : pandas DataFrame
+        demand centers with "Lat [deg]" and "Lon [deg]" columns.
+
+    Returns
+    -------
+    demand_hexagons : pandas Series
+        index of the hexagon containing each demand center, or NaN for demand
+        centers outside the hexagons.
+    '''
+    points = gpd.GeoDataFrame(geometry=gpd.points_from_xy(demand_centers['Lon [deg]'],
+                                                          demand_centers['Lat [deg]']),
+                              index=demand_centers.index,
+                              crs=hexagons.crs)
+    matches = gpd.sjoin(points, hexagons[['geometry']], how='left', predicate='within')
+    # a demand center on the border between hexagons is assigned to the first of them
+    matches = matches[~matches.index.duplicated()]
+    return matches['index_right'].reindex(demand_centers.index)
+
+
+def hilbert_order(hexagons, order=16):
+    '''
+    sorts the hexagons along a Hilbert curve through their centroids, so that
+    hexagons which are close in the sorted order are also close in space.
+
+    Parameters
+    ----------
+    hexagons : geopandas GeoDataFrame
+        hexagons.
+    order : int, optional
+        order of the Hilbert curve, which divides the extent of the hexagons
+        into a grid of 2**order by 2**order cells. Default is 16.
+
+    Returns
+    -------
+    index : pandas Index
+        hexagon index in order along the curve.
+    '''
+    centroids = hexagons.geometry.centroid
+    x = centroids.x.to_numpy()
+    y = centroids.y.to_numpy()
+    n = 2**order
+    # the same scale is used for both axes so the curve follows distances on the map
+    scale = (n - 1) / max(np.ptp(x), np.ptp(y), np.finfo(float).tiny)
+    x = np.round((x - x.min()) * scale).astype(np.int64)
+    y = np.round((y - y.min()) * scale).astype(np.int64)
+    d = np.zeros(len(x), dtype=np.int64)
+    s = n // 2
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx) ^ ry)
+        # rotate the quadrant so the curve is continuous
+        flip = ~ry & rx
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        x, y = np.where(ry, x, y), np.where(ry, y, x)
+        s //= 2
+    return hexagons.index[np.argsort(d, kind='stable')]
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compares wind turbines and solar panels for the ammonia plant.
+
+The per-unit profiles of every turbine and panel below are calculated in a
+single pass over the cutout, and cached separately so that the main
+optimization reuses the profiles of the turbine and panel it is set to. A
+sample of hexagons is then optimized for the first demand center with each
+combination of turbine and panel. The wind capacity limit of each hexagon
+is its number of turbines times the rated capacity of the turbine.
+
+The levelized cost of ammonia and plant capacities are saved for each
+hexagon and combination, and the mean cost of each combination and the
+number of hexagons where it is cheapest are printed.
+"""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+
+import hexagon_io
+import optimize_ammonia_plant as oap
+import parameters
+import profiles
+import spatial
+
+# atlite wind turbines and solar panels to compare
+turbines = ['NREL_ReferenceTurbine_2020ATB_4MW',
+            'Vestas_V80_2MW_gridstreamer',
+            'Enercon_E126_7500kW',
+            ]
+panels = ['CSi', 'CdTe']
+# number of hexagons to optimize, spread over the map
+sample_size = 10
+transport = 'trucking'
+report_path = 'Resources/technology_sweep.csv'
+
+
+def main():
+    country_parameters = parameters.read_excel(oap.country_excel_path, index_col='Country')
+    demand_parameters = parameters.read_excel(oap.demand_excel_path, index_col='Demand center')
+    weather_parameters = parameters.read_excel(oap.weather_excel_path,
+                                               index_col='Parameters'
+                                               ).squeeze('columns')
+    location = demand_parameters.index[0]
+
+    hexagons = hexagon_io.read_hexagons('hex_transport', columns=['country', 'theo_turbines', 'theo_pv'])
+    # all configurations are converted in one pass over the cutout, with the same settings as the optimization
+    cubes = profiles.profile_cubes('Cutouts/' + weather_parameters['Filename'] + '.nc', hexagons,
+                                   {**{turbine: ('wind', dict(turbine=turbine)) for turbine in turbines},
+                                    **{panel: ('pv', dict(panel=panel, orientation='latitude_optimal'))
+                                       for panel in panels}})
+    # hexagons evenly spaced along the space-filling curve are spread over the map
+    order = spatial.hilbert_order(hexagons)
+    sample = order[np.linspace(0, len(order) - 1, min(sample_size, len(order))).astype(int)]
+    demand_profile = oap.demand_schedule(demand_parameters.loc[location, 'Annual demand [kg/a]'],
+                                         oap.transport_excel_path,
+                                         oap.weather_excel_path,
+                                         freq=oap.freq)[0 if transport == 'trucking' else 1]
+    times = demand_profile.index
+
+    rows = []
+    for hexagon in sample:
+        for turbine, panel in itertools.product(turbines, panels):
+            result = oap.optimize_ammonia_plant(
+                wind_potential=profiles.hexagon_profile(cubes[turbine], hexagon, times),
+                pv_potential=profiles.hexagon_profile(cubes[panel], hexagon, times),
+                demand_profile=demand_profile,
+                wind_max_capacity=hexagons.loc[hexagon, 'theo_turbines']*profiles.turbine_capacity(turbine),
+                pv_max_capacity=hexagons.loc[hexagon, 'theo_pv'],
+                country_series=country_parameters.loc[hexagons.country[hexagon]],
+                solver_threads=oap.solver_threads)
+            rows.append([hexagon, turbine, panel, *result])
+    results = pd.DataFrame(rows, columns=['hexagon', 'turbine', 'panel'] + oap.result_columns)
+    results.to_csv(report_path, index=False)
+
+    cheapest = results.loc[results.groupby('hexagon')['production cost'].idxmin().dropna()]
+    summary = results.groupby(['turbine', 'panel'], sort=False)['production cost'].mean().to_frame('mean cost')
+    summary['cheapest hexagons'] = cheapest.groupby(['turbine', 'panel']).size().reindex(summary.index).fillna(0).astype(int)
+    print(f'Production cost of {len(sample)} hexagons for {transport} to {location}:')
+    print(summary.to_string(float_format=lambda value: f'{value:.4f}'))
+
+
+if __name__ == '__main__':
+    main()
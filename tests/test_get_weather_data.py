@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of building a cutout from tiles, with a local stand-in for the CDS API.
+
+The stand-in writes synthetic weather with netCDF4, as atlite does, and is
+defined at module level so the worker processes of build_cutout can run it.
+"""
+
+import os
+
+import pytest
+import xarray as xr
+from atlite.gis import get_coords
+
+import get_weather_data
+
+x = slice(-10, 2)
+y = slice(10, 16.3)
+snapshots = slice('2022-01-01', '2022-03-01')
+
+
+def synthetic_weather(coords):
+    '''
+    weather whose values are a function of the coordinates, so merged tiles
+    can be compared with the whole cutout.
+    '''
+    hours = coords['time'].astype('int64') / 3.6e12
+    return xr.Dataset({'height': (coords['y'] * 100 + coords['x']).transpose('y', 'x'),
+                       'wnd100m': (hours + coords['y'] * 10 + coords['x']).transpose('time', 'y', 'x')},
+                      attrs={'module': 'era5', 'prepared_features': ['height', 'wind']})
+
+
+def prepare_synthetic(path, tile, tmpdir):
+    synthetic_weather(get_coords(**tile)).to_netcdf(path)
+
+
+def prepare_without_february(path, tile, tmpdir):
+    if '2022-02' in os.path.basename(path):
+        raise ConnectionError('CDS API unavailable')
+    prepare_synthetic(path, tile, tmpdir)
+
+
+def test_tiles_prepared_in_parallel_match_whole_cutout(tmp_path):
+    path = str(tmp_path / 'cutout.nc')
+    tile_dir = str(tmp_path / 'tiles')
+    get_weather_data.build_cutout(path, x, y, snapshots, prepare=prepare_synthetic, tile_dir=tile_dir,
+                                  cells=15, workers=2)
+
+    expected = synthetic_weather(get_coords(x, y, snapshots))
+    with xr.open_dataset(path) as cutout:
+        xr.testing.assert_allclose(cutout[['height', 'wnd100m']].transpose(*expected['wnd100m'].dims),
+                                   expected[['height', 'wnd100m']])
+    assert os.listdir(tile_dir) == []
+
+
+def test_failed_tiles_are_reported_and_prepared_tiles_kept(tmp_path, monkeypatch):
+    monkeypatch.setattr(get_weather_data, 'retry_delay', 0)
+    path = str(tmp_path / 'cutout.nc')
+    tile_dir = str(tmp_path / 'tiles')
+    tiles = get_weather_data.weather_tiles(x, y, snapshots, cells=15)
+    with pytest.raises(RuntimeError, match='could not be prepared'):
+        get_weather_data.build_cutout(path, x, y, snapshots, prepare=prepare_without_february, tile_dir=tile_dir,
+                                      cells=15, workers=2)
+    assert not os.path.exists(path)
+    assert len(os.listdir(tile_dir)) == len([tile for tile in tiles if not tile.startswith('2022-02')])
+
+    get_weather_data.build_cutout(path, x, y, snapshots, prepare=prepare_synthetic, tile_dir=tile_dir,
+                                  cells=15, workers=2)
+    assert os.path.exists(path)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of reading HiGHS solutions, with sample solution files in the "pretty"
+style of HiGHS and a stand-in for the HiGHS executable which copies them.
+"""
+
+import os
+import stat
+import sys
+
+import numpy as np
+import pandas as pd
+import pypsa.linopf
+import pypsa.linopt
+
+import solvers
+
+header = '    Index Status        Lower        Upper       Primal         Dual  Name'
+
+
+def write_solution(path, n_columns, n_rows, status='Optimal', objective=1.5, dual_sign=1):
+    '''
+    writes a solution file of variables x1, x2, ... and constraints c1, c2, ...
+    whose primal and dual values are a function of their number.
+    '''
+    lines = ['Columns', header]
+    lines += [f'{i:9d} {"BS":>6} {0:>12g} {"inf":>12} {(i + 1) * 1.25:>12g} {0:>12g}  x{i + 1}'
+              for i in range(n_columns)]
+    lines += ['Rows', header]
+    lines += [f'{i:9d} {"LB":>6} {0:>12g} {"inf":>12} {0:>12g} {dual_sign * (i + 1) * 0.5:>12g}  c{i + 1}'
+              for i in range(n_rows)]
+    lines += ['', f'Model status: {status}', '', f'Objective value: {objective}']
+    with open(path, 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+
+
+def stand_in_highs(directory, sample_path):
+    '''
+    writes an executable named highs which copies a sample solution file to
+    the solution file in its options file and prints the status and objective.
+    '''
+    path = os.path.join(directory, 'highs')
+    with open(path, 'w') as file:
+        file.write(f'''#!{sys.executable}
+import shutil, sys
+args = dict(zip(sys.argv[1::2], sys.argv[2::2]))
+options = dict(line.split(' = ', 1) for line in open(args['--options_file']).read().splitlines())
+shutil.copy({sample_path!r}, options['solution_file'])
+print('Model   status      : Optimal')
+print('Objective value     :  1.5000000000e+00')
+''')
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+
+
+def test_reader_matches_pypsa(tmp_path, monkeypatch):
+    sample_path = str(tmp_path / 'sample.sol')
+    # PyPSA guesses column widths from the first 100 rows, so only reads files of about that size with
+    # values of similar widths correctly
+    write_solution(sample_path, n_columns=99, n_rows=99)
+    stand_in_highs(str(tmp_path), sample_path)
+    monkeypatch.setenv('PATH', str(tmp_path) + os.pathsep + os.environ['PATH'])
+    # PyPSA writes its options file in the working directory
+    monkeypatch.chdir(tmp_path)
+
+    expected = pypsa.linopt.run_and_read_highs(None, 'problem.lp', str(tmp_path / 'pypsa.sol'), None)
+    result = solvers.run_and_read_highs(None, 'problem.lp', str(tmp_path / 'solvers.sol'), None)
+
+    assert result[:2] == expected[:2] == ('ok', 'optimal')
+    pd.testing.assert_series_equal(result[2].sort_index(), expected[2].sort_index(), check_names=False)
+    pd.testing.assert_series_equal(result[3].sort_index(), expected[3].sort_index(), check_names=False)
+    assert result[4] == expected[4] == 1.5
+
+
+def test_long_names_after_first_rows(tmp_path):
+    # names and values lengthen after the rows PyPSA would guess column widths from
+    path = str(tmp_path / 'sample.sol')
+    write_solution(path, n_columns=1200, n_rows=1200, dual_sign=-1)
+    termination_condition, variables_sol, constraints_dual, objective = solvers.read_highs_solution(path)
+
+    assert termination_condition == 'optimal'
+    assert list(variables_sol.index) == list(range(1, 1201))
+    np.testing.assert_allclose(variables_sol.to_numpy(), np.arange(1, 1201) * 1.25)
+    assert list(constraints_dual.index) == list(range(1, 1201))
+    np.testing.assert_allclose(constraints_dual.to_numpy(), -np.arange(1, 1201) * 0.5)
+
+
+def test_not_optimal(tmp_path):
+    path = str(tmp_path / 'sample.sol')
+    write_solution(path, n_columns=3, n_rows=2, status='Infeasible', objective='inf')
+    assert solvers.read_highs_solution(path) == ('infeasible', None, None, None)
+
+
+def test_reader_only_replaced_within_block():
+    original = pypsa.linopf.run_and_read_highs
+    with solvers.highs_reader():
+        assert pypsa.linopf.run_and_read_highs is solvers.run_and_read_highs
+    assert pypsa.linopf.run_and_read_highs is original
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of the time aggregation of the ammonia plant optimization, on small
+synthetic wind, solar and demand series.
+"""
+
+import numpy as np
+import pandas as pd
+import pypsa
+import pytest
+
+import time_aggregation
+
+
+def synthetic_year(start='2022-01-01', days=365, freq='3H', seed=0):
+    '''
+    wind, solar and demand series of a year at a regular frequency.
+    '''
+    index = pd.date_range(start, periods=days * 24 // int(freq[:-1]), freq=freq)
+    hours = np.arange(len(index)) * int(freq[:-1])
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'wind': np.clip(0.4 + 0.3 * np.sin(hours / 60) + rng.normal(0, 0.1, len(index)), 0, 1),
+                         'solar': np.clip(np.sin((hours % 24 - 6) / 12 * np.pi), 0, None)
+                         * (0.8 + 0.2 * np.sin(hours / 1400)),
+                         'demand': np.full(len(index), 40.)},
+                        index=index)
+
+
+def reconstruct(aggregation):
+    '''
+    series of the year rebuilt from the typical period of each period of the year.
+    '''
+    return pd.concat([aggregation.data[aggregation.periods == period] for period in aggregation.sequence])
+
+
+def test_typical_period_weightings():
+    series = synthetic_year()
+    aggregation = time_aggregation.typical_periods(series, n_periods=8)
+
+    assert aggregation.hours == 3
+    assert aggregation.weightings['objective'].sum() == pytest.approx(len(series) * aggregation.hours)
+    assert aggregation.weightings['generators'].sum() == pytest.approx(len(series) * aggregation.hours)
+    assert (aggregation.weightings['stores'] == aggregation.hours).all()
+    assert aggregation.weightings.index.equals(aggregation.data.index)
+
+
+def test_typical_periods_reconstruct_year():
+    # a year made of three kinds of day is represented exactly by three typical days
+    days = synthetic_year(days=3)
+    rng = np.random.default_rng(1)
+    order = rng.integers(0, 3, 365)
+    order[:3] = [0, 1, 2]
+    values = np.concatenate([days.to_numpy()[day * 8:(day + 1) * 8] for day in order])
+    series = pd.DataFrame(values, columns=days.columns, index=pd.date_range('2022-01-01', periods=365 * 8, freq='3H'))
+    aggregation = time_aggregation.typical_periods(series, n_periods=3)
+
+    assert len(aggregation.sequence) == 365
+    np.testing.assert_allclose(reconstruct(aggregation).to_numpy(), series.to_numpy())
+    counts = aggregation.weightings['objective'] / aggregation.hours
+    assert (counts == np.bincount(aggregation.sequence)[aggregation.periods]).all()
+
+
+def test_typical_periods_keep_totals():
+    series = synthetic_year()
+    aggregation = time_aggregation.typical_periods(series, n_periods=8)
+    counts = aggregation.weightings['objective'] / aggregation.hours
+
+    pd.testing.assert_series_equal(aggregation.data.mul(counts, axis=0).sum(), series.sum())
+    assert (aggregation.data.max() <= series.max() + 1e-12).all()
+
+
+def test_shorter_last_period():
+    # a year of 365 days split into weeks leaves one day, which is its own typical period
+    series = synthetic_year()
+    aggregation = time_aggregation.typical_periods(series, n_periods=4, period_hours=24 * 7)
+
+    assert len(aggregation.sequence) == 53
+    assert aggregation.sequence[-1] == aggregation.periods.max()
+    assert (aggregation.sequence[:-1] != aggregation.sequence[-1]).all()
+    assert len(reconstruct(aggregation)) == len(series)
+
+
+def test_segments_are_contiguous():
+    series = synthetic_year()
+    aggregation = time_aggregation.segments(series, n_segments=100)
+    sizes = aggregation.weightings['stores'] / aggregation.hours
+
+    assert len(aggregation.data) == 100
+    assert aggregation.data.index[0] == series.index[0]
+    assert aggregation.data.index.is_monotonic_increasing
+    # each segment starts where the one before ends, and the last ends with the series
+    np.testing.assert_allclose(np.diff(aggregation.data.index) / pd.Timedelta(hours=aggregation.hours), sizes[:-1])
+    assert sizes.sum() == len(series)
+    for start, size, (_, mean) in zip(aggregation.data.index, sizes, aggregation.data.iterrows()):
+        pd.testing.assert_series_equal(series.loc[start:].iloc[:int(size)].mean(), mean, check_names=False)
+
+
+def test_segment_weightings_keep_totals():
+    series = synthetic_year()
+    aggregation = time_aggregation.segments(series, n_segments=100)
+
+    for weighting in ['objective', 'stores', 'generators']:
+        assert aggregation.weightings[weighting].sum() == pytest.approx(len(series) * aggregation.hours)
+    sizes = aggregation.weightings['stores'] / aggregation.hours
+    pd.testing.assert_series_equal(aggregation.data.mul(sizes, axis=0).sum(), series.sum())
+
+
+def test_leap_year_resolution():
+    # store weightings follow the hours elapsed, while the objective is annualized to 8760 hours as without aggregation
+    series = synthetic_year(start='2024-01-01', days=366)
+    aggregation = time_aggregation.segments(series, n_segments=100)
+
+    assert aggregation.hours == 3
+    assert aggregation.weightings['stores'].sum() == pytest.approx(len(series) * 3)
+    assert aggregation.weightings['objective'].sum() == pytest.approx(8760)
+
+
+def plant_network():
+    n = pypsa.Network()
+    n.add('Bus', 'Hydrogen')
+    n.add('Link', 'HB', bus0='Hydrogen', bus1='Hydrogen', ramp_limit_up=0.2, ramp_limit_down=0.3)
+    n.add('Store', 'CompressedH2Store', bus='Hydrogen', e_cyclic=True, e_max_pu=1.)
+    return n
+
+
+def test_models_restore_network():
+    n = plant_network()
+    stores = n.stores.copy()
+    links = n.links.copy()
+    series = synthetic_year()
+
+    with time_aggregation.typical_period_model(n, time_aggregation.typical_periods(series, n_periods=8)):
+        assert n.links[['ramp_limit_up', 'ramp_limit_down']].isna().all().all()
+        assert not n.stores.at['CompressedH2Store', 'e_cyclic']
+    pd.testing.assert_frame_equal(n.stores, stores)
+    pd.testing.assert_frame_equal(n.links, links)
+
+    with time_aggregation.segment_model(n, time_aggregation.segments(series, n_segments=100)):
+        assert n.links[['ramp_limit_up', 'ramp_limit_down']].isna().all().all()
+    pd.testing.assert_frame_equal(n.links, links)
+
+
+def test_typical_periods_reject_standing_losses():
+    n = plant_network()
+    n.stores['standing_loss'] = 0.01
+    with pytest.raises(ValueError, match='standing losses'):
+        with time_aggregation.typical_period_model(n, time_aggregation.typical_periods(synthetic_year())):
+            pass
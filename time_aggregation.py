@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reduces the number of snapshots of the ammonia plant optimization.
+
+Two methods are offered, both applied to the wind, solar and demand series
+of a hexagon at the model frequency:
+
+- typical periods: the year is split into periods of equal length, e.g.
+  days, which are clustered by their normalized profiles. Each cluster is
+  represented by its medoid, weighted by the number of periods in the
+  cluster. The state of charge of the stores is followed through the
+  sequence of periods of the year, so storage can still shift energy
+  between seasons.
+- segments: neighbouring snapshots with similar profiles are merged into
+  segments of varying duration. The chronology is kept, so stores need no
+  special treatment. Ramp limits are scaled by the time between segments.
+
+The reduced series come with snapshot weightings: the objective and
+generator weightings are each snapshot's share of the 8760 hours of a year,
+as for runs without aggregation, and the store weightings are the hours
+elapsed in each snapshot.
+"""
+
+import functools
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+from pypsa.linopt import define_constraints, define_variables, get_var, linexpr
+from scipy.cluster.hierarchy import fcluster, linkage
+
+import p_auxiliary as aux
+
+
+@dataclass(frozen=True)
+class Aggregation:
+    # reduced series, indexed by snapshot
+    data: pd.DataFrame
+    # "objective", "stores" and "generators" snapshot weightings
+    weightings: pd.DataFrame
+    # typical period of each snapshot-- None for segments
+    periods: pd.Series = field(default=None)
+    # typical period of each period of the year, in order-- None for segments
+    sequence: np.ndarray = field(default=None)
+    # hours between the snapshots of the series before aggregation
+    hours: float = field(default=None)
+
+
+def aggregate(series, method, **settings):
+    '''
+    reduces the snapshots of a set of time series.
+
+    Parameters
+    ----------
+    series : pandas DataFrame
+        time series at a regular frequency covering one year.
+    method : string
+        "typical periods" or "segments".
+    settings : keyword arguments
+        passed to typical_periods() or segments().
+
+    Returns
+    -------
+    aggregation : Aggregation
+        reduced series and their snapshot weightings.
+    '''
+    if method == 'typical periods':
+        return typical_periods(series, **settings)
+    if method == 'segments':
+        return segments(series, **settings)
+    raise ValueError(f'Time aggregation method "{method}" is not supported. Choose "typical periods" or "segments".')
+
+
+def _normalize(series):
+    values = series.to_numpy(dtype=float)
+    scale = np.abs(values).max(axis=0)
+    scale[scale == 0] = 1
+    return values / scale
+
+
+def typical_periods(series, n_periods=12, period_hours=24):
+    '''
+    clusters the periods of the year into typical periods.
+
+    Periods are clustered with Ward's hierarchical method and represented by
+    the member closest to the cluster center. The representative profiles are
+    then scaled so that the weighted annual total of each series is kept. A
+    last period which is shorter than the others is kept as it is.
+
+    Parameters
+    ----------
+    series : pandas DataFrame
+        time series at a regular frequency covering one year.
+    n_periods : int, optional
+        number of typical periods. Default is 12.
+    period_hours : int, optional
+        length of each period in hours. Default is 24.
+
+    Returns
+    -------
+    aggregation : Aggregation
+        series of the typical periods in chronological order of their
+        representative periods, with snapshot weightings.
+    '''
+    # the objective weighting of each snapshot at the model frequency, as used for resampled runs
+    weight = 8760 / len(series)
+    hours = aux.snapshot_duration(series.index)
+    length = int(round(period_hours / hours))
+    n_full = len(series) // length
+    if n_full < 2:
+        raise ValueError(f'Periods of {period_hours} hours are too long to cluster a series of {len(series)} snapshots.')
+    features = _normalize(series)[:n_full * length].reshape(n_full, -1)
+    labels = fcluster(linkage(features, method='ward'), min(n_periods, n_full), criterion='maxclust')
+
+    # each cluster is represented by its medoid, and typical periods are ordered by their medoid
+    medoids = []
+    for label in np.unique(labels):
+        members = np.flatnonzero(labels == label)
+        distances = ((features[members] - features[members].mean(axis=0)) ** 2).sum(axis=1)
+        medoids.append(members[np.argmin(distances)])
+    medoids = np.sort(medoids)
+    period_of_medoid = {labels[medoid]: position for position, medoid in enumerate(medoids)}
+    sequence = np.array([period_of_medoid[label] for label in labels])
+    counts = np.bincount(sequence, minlength=len(medoids))
+
+    positions = (medoids[:, np.newaxis] * length + np.arange(length)).ravel()
+    periods = np.repeat(np.arange(len(medoids)), length)
+    representative_counts = np.repeat(counts, length)
+    # the last, shorter period is its own typical period
+    if len(series) > n_full * length:
+        positions = np.append(positions, np.arange(n_full * length, len(series)))
+        periods = np.append(periods, np.full(len(series) - n_full * length, len(medoids)))
+        representative_counts = np.append(representative_counts, np.ones(len(series) - n_full * length, dtype=int))
+        sequence = np.append(sequence, len(medoids))
+    data = series.iloc[positions].copy()
+
+    # scale the typical periods so the weighted total of each series is kept, without exceeding its maximum
+    for column in data.columns:
+        maximum = series[column].max()
+        for _ in range(20):
+            total = (data[column] * representative_counts).sum()
+            if total <= 0 or np.isclose(total, series[column].sum()):
+                break
+            data[column] = np.minimum(data[column] * series[column].sum() / total, maximum)
+
+    weightings = pd.DataFrame({'objective': representative_counts * weight,
+                               'stores': hours,
+                               'generators': representative_counts * weight},
+                              index=data.index)
+    return Aggregation(data, weightings, pd.Series(periods, index=data.index), sequence, hours)
+
+
+def segments(series, n_segments=730):
+    '''
+    merges neighbouring snapshots into segments of varying duration.
+
+    Segments are merged in turn where merging adds least to the sum of squared
+    deviations of the normalized series from the segment means.
+
+    Parameters
+    ----------
+    series : pandas DataFrame
+        time series at a regular frequency covering one year.
+    n_segments : int, optional
+        number of segments. Default is 730.
+
+    Returns
+    -------
+    aggregation : Aggregation
+        mean of each series over each segment, indexed by the start of the
+        segment, with snapshot weightings.
+    '''
+    weight = 8760 / len(series)
+    hours = aux.snapshot_duration(series.index)
+    values = _normalize(series)
+    sizes = np.ones(len(values))
+    means = values.copy()
+    starts = np.arange(len(values))
+
+    def merge_cost(left):
+        # increase in the sum of squared deviations from merging each segment with the next
+        return sizes[left] * sizes[left + 1] / (sizes[left] + sizes[left + 1]) \
+            * ((means[left] - means[left + 1]) ** 2).sum(axis=-1)
+
+    costs = merge_cost(np.arange(len(values) - 1))
+    while len(sizes) > n_segments:
+        left = np.argmin(costs)
+        means[left] = (sizes[left] * means[left] + sizes[left + 1] * means[left + 1]) / (sizes[left] + sizes[left + 1])
+        sizes[left] += sizes[left + 1]
+        sizes = np.delete(sizes, left + 1)
+        means = np.delete(means, left + 1, axis=0)
+        starts = np.delete(starts, left + 1)
+        costs = np.delete(costs, left)
+        for neighbour in (left - 1, left):
+            if 0 <= neighbour < len(costs):
+                costs[neighbour] = merge_cost(neighbour)
+
+    segment = np.repeat(np.arange(len(sizes)), sizes.astype(int))
+    data = series.groupby(segment).mean()
+    data.index = series.index[starts]
+    weightings = pd.DataFrame({'objective': sizes * weight,
+                               'stores': sizes * hours,
+                               'generators': sizes * weight},
+                              index=data.index)
+    return Aggregation(data, weightings, hours=hours)
+
+
+@contextmanager
+def typical_period_model(n, aggregation):
+    '''
+    prepares a network with the snapshots of typical periods to be solved,
+    and restores it afterwards.
+
+    PyPSA links the stores and ramp limits of consecutive snapshots, which
+    are in different typical periods at the end of each period. Instead,
+    stores are followed through the periods of the year and ramp limits are
+    applied within each typical period by the constraints of the yielded
+    function.
+
+    Parameters
+    ----------
+    n : pypsa Network
+        plant network with the snapshots of aggregation.
+    aggregation : Aggregation
+        typical periods.
+
+    Yields
+    ------
+    extra_functionality : function
+        constraints of the plant and of the typical periods, for n.lopf().
+    '''
+    if (n.stores.standing_loss != 0).any():
+        raise ValueError('Typical periods do not support stores with standing losses.')
+    stores = n.stores[['e_cyclic', 'e_initial', 'e_min_pu', 'e_max_pu']].copy()
+    ramp_limits = n.links[['ramp_limit_up', 'ramp_limit_down']].copy()
+    # the energy of each store in PyPSA's model is only its change since the start of the year, which can
+    # accumulate over the typical periods
+    bound = len(np.unique(aggregation.sequence)) + 1
+    n.stores['e_cyclic'] = False
+    n.stores['e_initial'] = 0.
+    n.stores['e_min_pu'] = -bound
+    n.stores['e_max_pu'] = bound
+    n.links[['ramp_limit_up', 'ramp_limit_down']] = np.nan
+    try:
+        yield functools.partial(_typical_period_constraints,
+                                aggregation=aggregation,
+                                stores=stores,
+                                ramp_limits=ramp_limits)
+    finally:
+        n.stores[stores.columns] = stores
+        n.links[ramp_limits.columns] = ramp_limits
+
+
+@contextmanager
+def segment_model(n, aggregation):
+    '''
+    prepares a network with the snapshots of segments to be solved, and
+    restores it afterwards.
+
+    PyPSA limits the ramp of links between consecutive snapshots by the same
+    amount whatever their duration. Instead, ramp limits are scaled by the
+    time between the middle of each segment and the middle of the one before,
+    in snapshots of the series before aggregation, by the constraints of the
+    yielded function.
+
+    Parameters
+    ----------
+    n : pypsa Network
+        plant network with the snapshots of aggregation.
+    aggregation : Aggregation
+        segments.
+
+    Yields
+    ------
+    extra_functionality : function
+        constraints of the plant with scaled ramp limits, for n.lopf().
+    '''
+    ramp_limits = n.links[['ramp_limit_up', 'ramp_limit_down']].copy()
+    n.links[['ramp_limit_up', 'ramp_limit_down']] = np.nan
+    try:
+        yield functools.partial(_segment_constraints, aggregation=aggregation, ramp_limits=ramp_limits)
+    finally:
+        n.links[ramp_limits.columns] = ramp_limits
+
+
+def _segment_constraints(n, snapshots, aggregation, ramp_limits):
+    durations = aggregation.weightings['stores'].reindex(snapshots).to_numpy()
+    # the segment before the first is the last, so the ramp limits are cyclic
+    previous = np.roll(np.arange(len(snapshots)), 1)
+    ramp_scale = (durations + durations[previous]) / 2 / aggregation.hours
+    aux.extra_functionalities(n, snapshots, previous=previous, ramp_limits=ramp_limits, ramp_scale=ramp_scale,
+                              duration=aggregation.hours)
+
+
+def _typical_period_constraints(n, snapshots, aggregation, stores, ramp_limits):
+    periods = aggregation.periods.reindex(snapshots).to_numpy()
+    first = np.r_[True, periods[1:] != periods[:-1]]
+    last = np.r_[periods[1:] != periods[:-1], True]
+    # the snapshot before the first of each period is the last of the same period
+    position = np.arange(len(snapshots))
+    previous = np.where(first, np.flatnonzero(last)[np.cumsum(first) - 1], position - 1)
+    aux.extra_functionalities(n, snapshots, previous=previous, ramp_limits=ramp_limits, duration=aggregation.hours)
+    _link_storage(n, snapshots, aggregation, stores, first, last)
+
+
+def _link_storage(n, snapshots, aggregation, stores, first, last):
+    '''
+    follows the state of charge of the stores through the periods of the year.
+
+    The state of charge at the start of each period of the year is a new
+    variable, which changes by the net charging of its typical period. The
+    state of charge within a period is this plus the change since the start
+    of the typical period, which is bounded through its minimum and maximum.
+    '''
+    e = get_var(n, 'Store', 'e').loc[snapshots]
+    stores_i = e.columns
+    e_values = e.to_numpy()
+    period = np.cumsum(first) - 1
+    n_typical = period[-1] + 1
+    # energy of each store in PyPSA's model at the end and before the start of each typical period--
+    # there is no variable (-1) before the first
+    e_end = e_values[last]
+    e_before = np.vstack([np.full((1, len(stores_i)), -1), e_end[:-1]])
+
+    # constraints and variables are not named after the stores, as PyPSA would keep their values with the stores
+    def constraint(lhs, sense, rhs, attr, index, columns=stores_i):
+        define_constraints(n, pd.DataFrame(lhs, index=index, columns=columns), sense, rhs, 'TypicalPeriods', attr)
+
+    # change in each store since the start of its typical period, and its minimum and maximum
+    typical_index = pd.RangeIndex(n_typical)
+    change_min = define_variables(n, -np.inf, 0, 'TypicalPeriods', 'typical_period_min', axes=[typical_index, stores_i])
+    change_max = define_variables(n, 0, np.inf, 'TypicalPeriods', 'typical_period_max', axes=[typical_index, stores_i])
+    change_min = change_min.to_numpy()
+    change_max = change_max.to_numpy()
+    constraint(linexpr((1, change_min[period]), (-1, e_values), (1, e_before[period]), as_pandas=False),
+               '<=', 0, 'typical_period_min', snapshots)
+    constraint(linexpr((1, e_values), (-1, e_before[period]), (-1, change_max[period]), as_pandas=False),
+               '<=', 0, 'typical_period_max', snapshots)
+
+    # state of charge at the start of each period of the year, which changes by the net charging of its typical period
+    sequence = aggregation.sequence
+    sequence_index = pd.RangeIndex(len(sequence))
+    state = define_variables(n, 0, np.inf, 'TypicalPeriods', 'state_of_charge_period', axes=[sequence_index, stores_i])
+    state = state.to_numpy()
+    following = np.roll(state, -1, axis=0)
+    lhs = linexpr((1, following), (-1, state), (-1, e_end[sequence]), (1, e_before[sequence]), as_pandas=False)
+    # after the last period, the state of charge returns to its start, or starts from the initial energy
+    cyclic = stores['e_cyclic'].reindex(stores_i).to_numpy(dtype=bool)
+    constraint(lhs[:-1], '=', 0, 'state_of_charge_period', sequence_index[:-1])
+    constraint(lhs[-1:, cyclic], '=', 0, 'state_of_charge_cyclic', sequence_index[-1:], stores_i[cyclic])
+    constraint(linexpr((1, state[:1, ~cyclic]), as_pandas=False),
+               '=', stores['e_initial'].reindex(stores_i[~cyclic]).to_numpy()[np.newaxis, :],
+               'state_of_charge_initial', sequence_index[:1], stores_i[~cyclic])
+
+    # the state of charge within each period of the year stays between the store limits
+    e_min_pu = stores['e_min_pu'].reindex(stores_i).to_numpy()
+    e_max_pu = stores['e_max_pu'].reindex(stores_i).to_numpy()
+    extendable = n.stores.e_nom_extendable.reindex(stores_i).to_numpy(dtype=bool)
+    e_nom = np.full(len(stores_i), -1)
+    e_nom[extendable] = get_var(n, 'Store', 'e_nom').reindex(stores_i[extendable]).to_numpy()
+    fixed_e_nom = np.where(extendable, 0., n.stores.e_nom.reindex(stores_i).to_numpy())
+    constraint(linexpr((1, state), (1, change_min[sequence]), (-e_min_pu, e_nom[np.newaxis, :]), as_pandas=False),
+               '>=', np.broadcast_to(e_min_pu * fixed_e_nom, state.shape), 'state_of_charge_period_lower',
+               sequence_index)
+    constraint(linexpr((1, state), (1, change_max[sequence]), (-e_max_pu, e_nom[np.newaxis, :]), as_pandas=False),
+               '<=', np.broadcast_to(e_max_pu * fixed_e_nom, state.shape), 'state_of_charge_period_upper',
+               sequence_index)
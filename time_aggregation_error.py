@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reports the error of time aggregation in the ammonia plant optimization.
+
+A sample of hexagons is optimized for the first demand center with every
+snapshot at the model frequency and with each of the time aggregation
+settings below. The levelized cost of ammonia, plant capacities and solve
+times are saved for each hexagon, and the error in the levelized cost and
+the speed-up of each setting are printed.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+import hexagon_io
+import optimize_ammonia_plant as oap
+import parameters
+import profiles
+import spatial
+
+# time aggregation settings to compare with the full-resolution run
+aggregations = {'12 typical days': dict(method='typical periods', n_periods=12, period_hours=24),
+                '24 typical days': dict(method='typical periods', n_periods=24, period_hours=24),
+                '730 segments': dict(method='segments', n_segments=730),
+                }
+# number of hexagons to optimize, spread over the map
+sample_size = 10
+transport = 'trucking'
+report_path = 'Resources/time_aggregation_error.csv'
+
+
+def main():
+    country_parameters = parameters.read_excel(oap.country_excel_path, index_col='Country')
+    demand_parameters = parameters.read_excel(oap.demand_excel_path, index_col='Demand center')
+    weather_parameters = parameters.read_excel(oap.weather_excel_path,
+                                               index_col='Parameters'
+                                               ).squeeze('columns')
+    location = demand_parameters.index[0]
+
+    hexagons = hexagon_io.read_hexagons('hex_transport', columns=['country', 'theo_turbines', 'theo_pv'])
+    # hexagons evenly spaced along the space-filling curve are spread over the map
+    order = spatial.hilbert_order(hexagons)
+    sample = order[np.linspace(0, len(order) - 1, min(sample_size, len(order))).astype(int)]
+    # profiles of all hexagons, so that the cached profiles of the optimization are reused
+    wind_profile, pv_profile = oap.renewable_profiles(hexagons, weather_parameters['Filename'])
+    demand_profile = oap.demand_schedule(demand_parameters.loc[location, 'Annual demand [kg/a]'],
+                                         oap.transport_excel_path,
+                                         oap.weather_excel_path,
+                                         freq=oap.freq)[0 if transport == 'trucking' else 1]
+    times = demand_profile.index
+
+    rows = []
+    for hexagon in sample:
+        kwargs = dict(wind_potential=profiles.hexagon_profile(wind_profile, hexagon, times),
+                      pv_potential=profiles.hexagon_profile(pv_profile, hexagon, times),
+                      demand_profile=demand_profile,
+                      wind_max_capacity=hexagons.loc[hexagon, 'theo_turbines']*profiles.turbine_capacity(oap.turbine),
+                      pv_max_capacity=hexagons.loc[hexagon, 'theo_pv'],
+                      country_series=country_parameters.loc[hexagons.country[hexagon]],
+                      solver_threads=oap.solver_threads)
+        for name, aggregation in {'full resolution': None, **aggregations}.items():
+            start = time.perf_counter()
+            result = oap.optimize_ammonia_plant(aggregation=aggregation, **kwargs)
+            rows.append([hexagon, name, time.perf_counter() - start, *result])
+    results = pd.DataFrame(rows, columns=['hexagon', 'aggregation', 'solve time'] + oap.result_columns)
+
+    # compare each setting with the full-resolution result of the same hexagon
+    full = results[results['aggregation'] == 'full resolution'].set_index('hexagon')
+    results['LCOA error'] = results['production cost'] / results['hexagon'].map(full['production cost']) - 1
+    results['speed-up'] = results['hexagon'].map(full['solve time']) / results['solve time']
+    results.to_csv(report_path, index=False)
+
+    summary = results[results['aggregation'] != 'full resolution'].groupby('aggregation', sort=False).agg(
+        mean_error=('LCOA error', 'mean'),
+        mean_absolute_error=('LCOA error', lambda error: error.abs().mean()),
+        max_absolute_error=('LCOA error', lambda error: error.abs().max()),
+        mean_speed_up=('speed-up', 'mean'))
+    print(f'Error in LCOA of {len(sample)} hexagons for {transport} to {location}, relative to full resolution:')
+    print(summary.to_string(float_format=lambda value: f'{value:.4f}'))
+
+
+if __name__ == '__main__':
+    main()
@@ -12,32 +12,56 @@ Bring together all previous data to calculate lowest-cost hydrogen
 
 #%% identify lowest-cost strategy: trucking vs. pipeline
 
-import geopandas as gpd
+import hexagon_io
 import pandas as pd
+import parameters
 import numpy as np
 
-hexagons = gpd.read_file('Resources/hex_water.geojson')
 demand_excel_path = 'Parameters/demand_parameters.xlsx'
-demand_parameters = pd.read_excel(demand_excel_path,
-                                  index_col='Demand center',
-                                  )
-
-demand_centers = demand_parameters.index
-for demand_center in demand_centers:
-    hexagons[f'{demand_center} trucking total cost'] =\
-        hexagons[f'{demand_center} road construction costs']\
-            +hexagons[f'{demand_center} trucking transport costs']\
-                +hexagons[f'{demand_center} trucking production cost']\
-                    +hexagons['Lowest water cost']
-    hexagons[f'{demand_center} pipeline total cost'] =\
-            hexagons[f'{demand_center} pipeline transport costs']\
-                +hexagons[f'{demand_center} pipeline production cost']\
-                    +hexagons['Lowest water cost']
-                    
-    for hexagon in hexagons.index:
-        hexagons.loc[hexagon,f'{demand_center} lowest cost'] = np.nanmin(
-            [hexagons.loc[hexagon,f'{demand_center} trucking total cost'],
-             hexagons.loc[hexagon,f'{demand_center} pipeline total cost']
-             ])
-        
-hexagons.to_file('Resources/hex_total_cost.geojson', driver='GeoJSON', encoding='utf-8')
+transport_modes = ['trucking', 'pipeline']
+
+
+def main():
+    demand_parameters = parameters.read_excel(demand_excel_path,
+                                              index_col='Demand center',
+                                              )
+
+    demand_centers = demand_parameters.index
+
+    cost_columns = ['Lowest water cost']
+    for demand_center in demand_centers:
+        cost_columns += [f'{demand_center} road construction costs',
+                         f'{demand_center} trucking transport costs',
+                         f'{demand_center} trucking production cost',
+                         f'{demand_center} pipeline transport costs',
+                         f'{demand_center} pipeline production cost']
+    hexagons = hexagon_io.read_hexagons('hex_water', columns=cost_columns, geometry=False)
+
+    # columns for all demand centers are collected and added to the hexagons at once
+    total_costs = {}
+    for demand_center in demand_centers:
+        total_costs[f'{demand_center} trucking total cost'] =\
+            hexagons[f'{demand_center} road construction costs']\
+                +hexagons[f'{demand_center} trucking transport costs']\
+                    +hexagons[f'{demand_center} trucking production cost']\
+                        +hexagons['Lowest water cost']
+        total_costs[f'{demand_center} pipeline total cost'] =\
+                hexagons[f'{demand_center} pipeline transport costs']\
+                    +hexagons[f'{demand_center} pipeline production cost']\
+                        +hexagons['Lowest water cost']
+
+        # lowest cost across transport modes, ignoring modes that are not possible in a hexagon
+        mode_costs = np.column_stack([total_costs[f'{demand_center} {mode} total cost'] for mode in transport_modes])
+        lowest_cost = np.fmin.reduce(mode_costs, axis=1)
+        lowest_cost_mode = pd.Categorical.from_codes(
+            np.where(np.isnan(lowest_cost), -1, np.argmin(np.where(np.isnan(mode_costs), np.inf, mode_costs), axis=1)),
+            categories=transport_modes)
+        total_costs[f'{demand_center} lowest cost'] = lowest_cost
+        total_costs[f'{demand_center} lowest cost mode'] = pd.Series(lowest_cost_mode, index=hexagons.index)
+
+    hexagon_io.add_columns('hex_water', 'hex_total_cost', pd.DataFrame(total_costs, index=hexagons.index))
+    hexagon_io.export_geojson('hex_total_cost')
+
+
+if __name__ == '__main__':
+    main()
@@ -8,49 +8,61 @@ Created on Wed Apr  5 13:26:19 2023
 Water costs for ammonia production in each hexagon
 """
 
-import geopandas as gpd
+import hexagon_io
 import pandas as pd
+import parameters
 import numpy as np
 
-hexagons = gpd.read_file('Resources/hex_lcoa.geojson')
 technology_parameters = "Parameters/technology_parameters.xlsx"
 country_excel_path = 'Parameters/country_parameters.xlsx'
 
-water_data = pd.read_excel(technology_parameters,
-                            sheet_name='Water',
-                            index_col='Parameter'
-                            ).squeeze("columns")
-country_parameters = pd.read_excel(country_excel_path,
-                                    index_col='Country')
-
-#%% water cost for each hexagon for each kg hydrogen produced
-
-h2o_costs_dom_water_bodies = np.empty(len(hexagons))
-h2o_costs_ocean = np.empty(len(hexagons))
-h2o_costs = np.empty(len(hexagons))
-
-electricity_demand_h2o_treatment = water_data['Freshwater treatment electricity demand (kWh/m3)']
-electricity_demand_h2o_ocean_treatment = water_data['Ocean water treatment electricity demand (kWh/m3)']
-water_transport_costs = water_data['Water transport cost (euros/100 km/m3)']
-water_spec_cost = water_data['Water specific cost (euros/m3)']
-water_demand = water_data['Water demand  (L/kg NH3)']
-
-for i in range(len(hexagons)):
-    h2o_costs_dom_water_bodies[i] =(water_spec_cost 
-                                        + (water_transport_costs/100)*min(hexagons['waterbody_dist'][i],
-                                                                          hexagons['waterway_dist'][i]) 
-                                        + electricity_demand_h2o_treatment*\
-                                            country_parameters.loc[hexagons.country[i],'Electricity price (euros/kWh)']
-                                        )*water_demand/1000
-    h2o_costs_ocean[i] =(water_spec_cost 
-                             + (water_transport_costs/100)*hexagons['ocean_dist'][i] 
-                             + electricity_demand_h2o_ocean_treatment*\
-                                 country_parameters.loc[hexagons.country[i],'Electricity price (euros/kWh)']
-                             )*water_demand/1000
-    h2o_costs[i] = min(h2o_costs_dom_water_bodies[i],h2o_costs_ocean[i])
-
-hexagons['Ocean water costs'] = h2o_costs_ocean
-hexagons['Freshwater costs'] = h2o_costs_dom_water_bodies
-hexagons['Lowest water cost'] = h2o_costs
-
-hexagons.to_file('Resources/hex_water.geojson', driver='GeoJSON', encoding='utf-8')
\ No newline at end of file
+
+def main():
+    hexagons = hexagon_io.read_hexagons('hex_lcoa',
+                                        columns=['country', 'waterbody_dist', 'waterway_dist', 'ocean_dist'],
+                                        geometry=False)
+
+    # each value column of the Water sheet is a water cost scenario-- the first is saved without a prefix
+    water_scenarios = parameters.read_excel(technology_parameters,
+                                            sheet_name='Water',
+                                            index_col='Parameter'
+                                            )
+    country_parameters = parameters.read_excel(country_excel_path,
+                                                index_col='Country')
+
+    #%% water cost for each hexagon for each kg hydrogen produced
+
+    # country electricity prices and water distances are looked up once for all scenarios
+    electricity_price = country_parameters.loc[hexagons['country'], 'Electricity price (euros/kWh)'].to_numpy()
+    freshwater_dist = np.fmin(hexagons['waterbody_dist'].to_numpy(), hexagons['waterway_dist'].to_numpy())
+    ocean_dist = hexagons['ocean_dist'].to_numpy()
+
+    water_costs = pd.DataFrame(index=hexagons.index)
+    for n, scenario in enumerate(water_scenarios.columns):
+        water_data = water_scenarios[scenario]
+        electricity_demand_h2o_treatment = water_data['Freshwater treatment electricity demand (kWh/m3)']
+        electricity_demand_h2o_ocean_treatment = water_data['Ocean water treatment electricity demand (kWh/m3)']
+        water_transport_costs = water_data['Water transport cost (euros/100 km/m3)']
+        water_spec_cost = water_data['Water specific cost (euros/m3)']
+        water_demand = water_data['Water demand  (L/kg NH3)']
+
+        h2o_costs_dom_water_bodies = (water_spec_cost
+                                      + (water_transport_costs/100)*freshwater_dist
+                                      + electricity_demand_h2o_treatment*electricity_price
+                                      )*water_demand/1000
+        h2o_costs_ocean = (water_spec_cost
+                           + (water_transport_costs/100)*ocean_dist
+                           + electricity_demand_h2o_ocean_treatment*electricity_price
+                           )*water_demand/1000
+        h2o_costs = np.fmin(h2o_costs_dom_water_bodies, h2o_costs_ocean)
+
+        prefix = '' if n == 0 else f'{scenario} '
+        water_costs[f'{prefix}Ocean water costs'] = h2o_costs_ocean
+        water_costs[f'{prefix}Freshwater costs'] = h2o_costs_dom_water_bodies
+        water_costs[f'{prefix}Lowest water cost'] = h2o_costs
+
+    hexagon_io.add_columns('hex_lcoa', 'hex_water', water_costs)
+
+
+if __name__ == '__main__':
+    main()